@@ -1,32 +1,334 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.routing import APIRoute
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
 import os
+import json
+import codecs
+import zlib
+import csv
+import io
+import tempfile
+import base64
+import re
+import hmac
+import hashlib
 import logging
+import fcntl
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, BeforeValidator, Field, ValidationError
+from typing import Annotated, List, Optional
+from collections import OrderedDict
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
 import uuid
+import time
 from datetime import datetime, timezone, timedelta
+import bson
 import httpx
+import orjson
+import msgpack
+import openpyxl
+import numpy as np
+import pandas as pd
 import asyncio
 
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Metrics
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label tuple"""
+
+    def __init__(self, name: str, help_text: str, label_names: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        # PyMongo listeners run on Motor's worker threads
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                label_text = _prom_labels(self.label_names, labels)
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text}{"," if label_text else ""}le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return lines
+
+class Counter:
+    """Prometheus-style counter, one value per label tuple"""
+    metric_type = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{{{_prom_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+class Gauge(Counter):
+    """Counter that may also go down"""
+    metric_type = "gauge"
+
+def _prom_labels(names: tuple, values: tuple) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    return ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+mongo_command_seconds = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command"),
+)
+mongo_command_failures = Counter(
+    "mongo_command_failures_total", "MongoDB commands that returned an error", ("collection", "command"),
+)
+mongo_pool_wait_seconds = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting to check out a pooled connection", ("address",),
+)
+mongo_pool_connections = Gauge(
+    "mongo_pool_connections", "Pooled connections by state", ("address", "state"),
+)
+http_requests = Counter(
+    "http_requests_total", "HTTP requests by route and status", ("method", "route", "status"),
+)
+http_request_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"),
+)
+
+class RequestTimings:
+    """Phase durations of one request, reported in its Server-Timing header"""
+
+    def __init__(self):
+        self.phases = {}  # name -> [seconds, occurrences]
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += 1
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [
+            f'{name};dur={seconds * 1000:.2f};desc="{count}x"'
+            for name, (seconds, count) in self.phases.items()
+        ]
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(entries)
+
+    def summary(self) -> str:
+        return " ".join(f"{name}={seconds * 1000:.1f}ms" for name, (seconds, _) in self.phases.items())
+
+# Set per request by the observe_requests middleware; Motor copies the
+# context onto its worker threads, so command listeners see it too
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def timed(phase: str):
+    """Time a block as a phase of the current request, if there is one"""
+    timings = request_timings.get()
+    return timings.phase(phase) if timings else nullcontext()
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Record per-collection, per-operation MongoDB command latency"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            target = event.command.get("collection")
+        collection = target if isinstance(target, str) else ""
+        self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event) -> tuple:
+        collection = self._pending.pop((event.connection_id, event.request_id), "")
+        labels = (collection, event.command_name)
+        mongo_command_seconds.observe(labels, event.duration_micros / 1e6)
+        timings = request_timings.get()
+        if timings:
+            timings.add("db", event.duration_micros / 1e6)
+        return labels
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        mongo_command_failures.inc(self._finish(event))
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Record connection checkout wait times and connections in use"""
+
+    def __init__(self):
+        # Checkout start and finish happen on the same thread
+        self._checkout_started = threading.local()
+
+    def _address(self, event) -> str:
+        return "%s:%s" % event.address
+
+    def connection_check_out_started(self, event):
+        self._checkout_started.value = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._checkout_started, "value", None)
+        if started is not None:
+            mongo_pool_wait_seconds.observe((self._address(event),), time.perf_counter() - started)
+        mongo_pool_connections.inc((self._address(event), "in_use"))
+
+    def connection_check_out_failed(self, event):
+        started = getattr(self._checkout_started, "value", None)
+        if started is not None:
+            mongo_pool_wait_seconds.observe((self._address(event),), time.perf_counter() - started)
+
+    def connection_checked_in(self, event):
+        mongo_pool_connections.inc((self._address(event), "in_use"), -1)
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc((self._address(event), "open"))
+
+    def connection_closed(self, event):
+        mongo_pool_connections.inc((self._address(event), "open"), -1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[CommandMetricsListener(), PoolMetricsListener()])
 db = client[os.environ['DB_NAME']]
 
+class TimedORJSONResponse(ORJSONResponse):
+    """orjson response whose rendering counts as the serialize phase"""
+
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return super().render(content)
+
+# MessagePack wire format, negotiated with Accept / Content-Type
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+def _msgpack_default(value):
+    # Same text form orjson gives datetimes, so both formats carry equal values
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__} to MessagePack")
+
+def _packb(value) -> bytes:
+    return msgpack.packb(value, default=_msgpack_default)
+
+def wants_msgpack(request: Request) -> bool:
+    accept = request.headers.get("accept", "")
+    return any(media_type in accept for media_type in MSGPACK_MEDIA_TYPES)
+
+class TimedMsgPackResponse(Response):
+    """MessagePack response whose rendering counts as the serialize phase"""
+
+    media_type = MSGPACK_MEDIA_TYPES[0]
+
+    def render(self, content) -> bytes:
+        with timed("serialize"):
+            return _packb(content)
+
+def negotiated_response(request: Request, content, headers: Optional[dict] = None) -> Response:
+    """MessagePack for clients that accept it, JSON otherwise"""
+    response_class = TimedMsgPackResponse if wants_msgpack(request) else TimedORJSONResponse
+    return response_class(content, headers={"Vary": "Accept", **(headers or {})})
+
+def _str_keyed_map(pairs) -> dict:
+    # msgpack also allows bytes keys, which JSON bodies can never contain
+    if not all(isinstance(key, str) for key, _ in pairs):
+        raise ValueError("MessagePack map keys must be strings")
+    return dict(pairs)
+
+class MsgPackRoute(APIRoute):
+    """Route whose JSON body may also arrive as MessagePack"""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        if self.body_field is None:
+            # Routes that read the raw stream themselves (e.g. restore)
+            return handler
+
+        async def route_handler(request: Request) -> Response:
+            content_type = request.headers.get("content-type", "")
+            if content_type.split(";")[0].strip() in MSGPACK_MEDIA_TYPES:
+                body = await request.body()
+                try:
+                    decoded = msgpack.unpackb(body, object_pairs_hook=_str_keyed_map)
+                except ValueError:
+                    raise HTTPException(status_code=400, detail="Invalid MessagePack body")
+                # Present the decoded body as already-parsed JSON
+                headers = [(name, value) for name, value in request.scope["headers"] if name != b"content-type"]
+                request = Request({**request.scope, "headers": headers + [(b"content-type", b"application/json")]}, request.receive)
+                request._body = body
+                request._json = decoded
+            return await handler(request)
+
+        return route_handler
+
 # Create the main app without a prefix
 app = FastAPI()
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", default_response_class=TimedORJSONResponse, route_class=MsgPackRoute)
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -60,11 +362,33 @@ class SessionData(BaseModel):
     session_token: str
     user: User
 
+# Record dates are stored as canonical YYYY-MM-DD strings, which sort
+# chronologically and so support indexed range queries
+CANONICAL_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+def normalize_date(value) -> str:
+    """Canonical YYYY-MM-DD form of a date, ISO datetime or YYYY/MM/DD string"""
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text.replace("Z", "+00:00")).date().isoformat()
+    except ValueError:
+        pass
+    for date_format in ("%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized date: {text!r}")
+
+RecordDate = Annotated[str, BeforeValidator(normalize_date)]
+
 # Petrol Pump Data Models
 class FuelSale(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    date: str  # ISO date string
+    date: RecordDate  # ISO date string
     fuel_type: str
     nozzle_id: str
     opening_reading: float
@@ -73,33 +397,458 @@ class FuelSale(BaseModel):
     rate: float
     amount: float
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class CreditSale(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    date: str
+    date: RecordDate
     customer_name: str
     amount: float
     description: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class IncomeExpense(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    date: str
+    date: RecordDate
     type: str  # "income" or "expense"
     category: str
     amount: float
     description: Optional[str] = None
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class FuelRate(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
-    date: str
+    date: RecordDate
     fuel_type: str
     rate: float
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+# Index management
+# Sort order of list pages; the (user_id, ...) index below serves it
+PAGE_SORT = [("date", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]
+PAGE_INDEX = [("user_id", ASCENDING)] + PAGE_SORT
+
+# Rate history of one fuel type, oldest first; later entries on the same
+# date supersede earlier ones
+RATE_HISTORY_SORT = [("date", ASCENDING), ("created_at", ASCENDING)]
+RATE_HISTORY_INDEX = [("user_id", ASCENDING), ("fuel_type", ASCENDING)] + RATE_HISTORY_SORT
+
+# Sort order of delta sync batches
+SYNC_SORT = [("updated_at", ASCENDING), ("id", ASCENDING)]
+SYNC_INDEX = [("user_id", ASCENDING)] + SYNC_SORT
+
+# One document per record id, so replayed or retried writes are idempotent
+RECORD_ID_INDEX = IndexModel([("user_id", ASCENDING), ("id", ASCENDING)], unique=True)
+
+INDEXES = {
+    "fuel_sales": [
+        IndexModel(PAGE_INDEX),
+        IndexModel(SYNC_INDEX),
+        RECORD_ID_INDEX,
+    ],
+    "credit_sales": [
+        IndexModel(PAGE_INDEX),
+        IndexModel(SYNC_INDEX),
+        RECORD_ID_INDEX,
+    ],
+    "income_expenses": [
+        IndexModel(PAGE_INDEX),
+        IndexModel(SYNC_INDEX),
+        RECORD_ID_INDEX,
+    ],
+    "fuel_rates": [
+        IndexModel(PAGE_INDEX),
+        IndexModel(SYNC_INDEX),
+        IndexModel(RATE_HISTORY_INDEX),
+        RECORD_ID_INDEX,
+    ],
+    "record_versions": [
+        IndexModel([("user_id", ASCENDING), ("collection", ASCENDING), ("date", ASCENDING)], unique=True),
+    ],
+    "nozzle_readings": [
+        IndexModel([("user_id", ASCENDING), ("nozzle_id", ASCENDING)], unique=True),
+    ],
+    "daily_summaries": [
+        IndexModel([("user_id", ASCENDING), ("date", ASCENDING)], unique=True),
+    ],
+    "revoked_sessions": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING)]),
+        # Let MongoDB purge sessions as soon as they expire
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+# Indexes superseded by the ones above, dropped by ensure_indexes
+RETIRED_INDEXES = {
+    "fuel_sales": ["user_id_1_date_1"],
+    "credit_sales": ["user_id_1_date_1"],
+    "income_expenses": ["user_id_1_date_1"],
+    "fuel_rates": ["user_id_1_date_1"],
+}
+
+# Representative query of every route, used to verify index coverage
+ROUTE_QUERIES = [
+    ("GET /api/fuel-sales", "fuel_sales", lambda user_id, date: {"user_id": user_id}, None),
+    ("GET /api/fuel-sales?date", "fuel_sales", lambda user_id, date: {"user_id": user_id, "date": date}, None),
+    ("GET /api/fuel-sales?limit", "fuel_sales", lambda user_id, date: {"user_id": user_id}, PAGE_SORT),
+    ("GET /api/fuel-sales?from&to", "fuel_sales", lambda user_id, date: {
+        "user_id": user_id, "date": {"$gte": date, "$lte": date}
+    }, None),
+    ("GET /api/credit-sales", "credit_sales", lambda user_id, date: {"user_id": user_id}, None),
+    ("GET /api/credit-sales?date", "credit_sales", lambda user_id, date: {"user_id": user_id, "date": date}, None),
+    ("GET /api/credit-sales?limit", "credit_sales", lambda user_id, date: {"user_id": user_id}, PAGE_SORT),
+    ("GET /api/credit-sales?from&to", "credit_sales", lambda user_id, date: {
+        "user_id": user_id, "date": {"$gte": date, "$lte": date}
+    }, None),
+    ("GET /api/income-expenses", "income_expenses", lambda user_id, date: {"user_id": user_id}, None),
+    ("GET /api/income-expenses?date", "income_expenses", lambda user_id, date: {"user_id": user_id, "date": date}, None),
+    ("GET /api/income-expenses?limit", "income_expenses", lambda user_id, date: {"user_id": user_id}, PAGE_SORT),
+    ("GET /api/income-expenses?from&to", "income_expenses", lambda user_id, date: {
+        "user_id": user_id, "date": {"$gte": date, "$lte": date}
+    }, None),
+    ("GET /api/fuel-rates", "fuel_rates", lambda user_id, date: {"user_id": user_id}, None),
+    ("GET /api/fuel-rates?date", "fuel_rates", lambda user_id, date: {"user_id": user_id, "date": date}, None),
+    ("GET /api/fuel-rates?limit", "fuel_rates", lambda user_id, date: {"user_id": user_id}, PAGE_SORT),
+    ("GET /api/fuel-rates?from&to", "fuel_rates", lambda user_id, date: {
+        "user_id": user_id, "date": {"$gte": date, "$lte": date}
+    }, None),
+    ("GET /api/sync/changes", "fuel_sales", lambda user_id, date: {
+        "user_id": user_id, "updated_at": {"$gt": datetime(2024, 1, 1)}
+    }, SYNC_SORT),
+    ("GET /api/fuel-rates/effective", "fuel_rates", lambda user_id, date: {
+        "user_id": user_id, "fuel_type": "Petrol", "date": {"$lte": date}
+    }, RATE_HISTORY_SORT),
+    ("GET /api/nozzles/readings", "nozzle_readings", lambda user_id, date: {"user_id": user_id}, None),
+    ("auth session lookup", "user_sessions", lambda user_id, date: {
+        "session_token": "explain", "expires_at": {"$gt": datetime.now(timezone.utc)}
+    }, None),
+    ("POST /api/auth/session cleanup", "user_sessions", lambda user_id, date: {"user_id": user_id}, None),
+]
+
+async def ensure_indexes() -> dict:
+    """Create every declared index; safe to run on each startup"""
+    report = {}
+    for collection_name, indexes in INDEXES.items():
+        try:
+            report[collection_name] = await db[collection_name].create_indexes(indexes)
+        except ConnectionFailure as e:
+            logger.error(f"Index creation skipped, database unreachable: {str(e)}")
+            break
+        except OperationFailure as e:
+            # e.g. an existing index with the same keys but different options
+            logger.error(f"Index creation failed for {collection_name}: {str(e)}")
+            report[collection_name] = {"error": str(e)}
+    
+    for collection_name, index_names in RETIRED_INDEXES.items():
+        try:
+            existing = await db[collection_name].index_information()
+            for index_name in index_names:
+                if index_name in existing:
+                    await db[collection_name].drop_index(index_name)
+        except (ConnectionFailure, OperationFailure) as e:
+            logger.error(f"Dropping retired indexes failed for {collection_name}: {str(e)}")
+    return report
+
+def _plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() query plan"""
+    stages = [plan.get("stage", "")]
+    if "inputStage" in plan:
+        stages.extend(_plan_stages(plan["inputStage"]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+def _plan_index_name(plan: dict) -> Optional[str]:
+    """Name of the index used by an explain() query plan, if any"""
+    if "indexName" in plan:
+        return plan["indexName"]
+    children = [plan["inputStage"]] if "inputStage" in plan else plan.get("inputStages", [])
+    for child in children:
+        name = _plan_index_name(child)
+        if name:
+            return name
+    return None
+
+async def explain_route_queries(user_id: str, date: str) -> List[dict]:
+    """Run explain() on each route's query and report the winning plan"""
+    results = []
+    for route, collection_name, build_query, sort in ROUTE_QUERIES:
+        cursor = db[collection_name].find(build_query(user_id, date))
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+        # Slot-based engine plans nest the classic plan under "queryPlan"
+        winning_plan = winning_plan.get("queryPlan", winning_plan)
+        stages = _plan_stages(winning_plan)
+        results.append({
+            "route": route,
+            "collection": collection_name,
+            "stages": stages,
+            "index": _plan_index_name(winning_plan),
+            "collection_scan": "COLLSCAN" in stages,
+        })
+    return results
+
+# Session cache
+class SessionCache:
+    """Bounded LRU cache of resolved users keyed by session token"""
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user_sessions _id -> token, to act on change-stream deletes
+        self._session_tokens = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, hit or not; a user resolved from the
+        # database is only cached if none happened while it was being read
+        self.generation = 0
+
+    def get(self, session_token: str) -> Optional[User]:
+        """Return the cached user for a token, or None on miss/expiry"""
+        entry = self._entries.get(session_token)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        user, valid_until, _ = entry
+        if time.time() >= valid_until:
+            self._drop(session_token)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(session_token)
+        self.hits += 1
+        return user
+
+    def set(self, session_token: str, user: User, expires_at: datetime, session_id=None, generation=None):
+        """Cache a user until the session expires or the TTL elapses
+
+        Pass the generation read before the lookup so that a logout racing
+        it is not undone.
+        """
+        if generation is not None and generation != self.generation:
+            return
+        if expires_at.tzinfo is None:
+            # Motor returns naive UTC datetimes
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        valid_until = min(expires_at.timestamp(), time.time() + self.ttl)
+
+        self._entries[session_token] = (user, valid_until, session_id)
+        self._entries.move_to_end(session_token)
+        if session_id is not None:
+            self._session_tokens[session_id] = session_token
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, session_token: str) -> bool:
+        entry = self._entries.pop(session_token, None)
+        if entry is None:
+            return False
+        self._session_tokens.pop(entry[2], None)
+        return True
+
+    def invalidate(self, session_token: str):
+        """Drop a single session token"""
+        self.generation += 1
+        if self._drop(session_token):
+            self.invalidations += 1
+
+    def invalidate_session(self, session_id):
+        """Drop the token of a user_sessions document, by its _id"""
+        self.generation += 1
+        session_token = self._session_tokens.get(session_id)
+        if session_token is not None:
+            self.invalidate(session_token)
+
+    def invalidate_user(self, user_id: str):
+        """Drop every cached session belonging to a user"""
+        self.generation += 1
+        tokens = [token for token, (user, _, _) in self._entries.items() if user.id == user_id]
+        for token in tokens:
+            self.invalidate(token)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+        self._session_tokens.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+session_cache = SessionCache(
+    maxsize=int(os.environ.get('SESSION_CACHE_SIZE', '10000')),
+    ttl=float(os.environ.get('SESSION_CACHE_TTL', '300')),
+)
+
+# Signed session tokens
+# SESSION_MODE=signed issues HMAC-signed tokens that carry the user, expiry
+# and a per-user session generation, verified without any database read.
+# Each login bumps the generation, retiring the user's older tokens the way
+# the DB mode's delete_many does; logout adds the token to a revocation list.
+SESSION_MODE = os.environ.get('SESSION_MODE', 'db')
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+SESSION_TTL = timedelta(days=7)
+SIGNED_TOKEN_PREFIX = "v1."
+
+if SESSION_MODE not in ("db", "signed"):
+    raise RuntimeError("SESSION_MODE must be 'db' or 'signed'")
+if SESSION_MODE == "signed" and not SESSION_SECRET:
+    raise RuntimeError("SESSION_SECRET is required when SESSION_MODE=signed")
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _token_signature(signed_part: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET.encode(), signed_part.encode(), hashlib.sha256).digest())
+
+class SignedSessions:
+    """Issue and verify signed tokens against in-memory generations and revocations"""
+
+    def __init__(self):
+        self.generations = {}  # user_id -> lowest generation still valid
+        self.revoked = {}  # jti -> expiry timestamp
+
+    def issue(self, user_data: dict, generation: int) -> tuple:
+        expires_at = datetime.now(timezone.utc).replace(microsecond=0) + SESSION_TTL
+        created_at = user_data["created_at"]
+        if created_at.tzinfo is None:
+            # Motor returns naive UTC datetimes
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        payload = {
+            "sub": user_data["id"],
+            "email": user_data["email"],
+            "name": user_data["name"],
+            "picture": user_data.get("picture"),
+            "created_at": created_at.isoformat(),
+            "gen": generation,
+            "exp": int(expires_at.timestamp()),
+            "jti": uuid.uuid4().hex,
+        }
+        signed_part = SIGNED_TOKEN_PREFIX + _b64encode(orjson.dumps(payload))
+        self.generations[user_data["id"]] = generation
+        return signed_part + "." + _token_signature(signed_part), expires_at
+
+    def decode(self, token: str) -> Optional[dict]:
+        """Payload of a well-signed, unexpired token, whether or not it is revoked"""
+        signed_part, _, signature = token.rpartition(".")
+        if not signed_part.startswith(SIGNED_TOKEN_PREFIX):
+            return None
+        # As bytes: compare_digest rejects str with non-ASCII characters
+        if not hmac.compare_digest(signature.encode(), _token_signature(signed_part).encode()):
+            return None
+        try:
+            payload = orjson.loads(_b64decode(signed_part[len(SIGNED_TOKEN_PREFIX):]))
+        except (ValueError, orjson.JSONDecodeError):
+            return None
+        if payload["exp"] <= time.time():
+            return None
+        return payload
+
+    def verify(self, token: str) -> Optional[User]:
+        payload = self.decode(token)
+        if payload is None or payload["jti"] in self.revoked:
+            return None
+        if payload["gen"] < self.generations.get(payload["sub"], 0):
+            return None
+        return User(
+            id=payload["sub"],
+            email=payload["email"],
+            name=payload["name"],
+            picture=payload.get("picture"),
+            # Tokens issued before created_at was carried fall back to the model default
+            **({"created_at": payload["created_at"]} if "created_at" in payload else {}),
+        )
+
+    def advance_generation(self, user_id: str, generation: int):
+        """Retire a user's older tokens after a login handled elsewhere"""
+        if generation > self.generations.get(user_id, 0):
+            self.generations[user_id] = generation
+
+    def revoke(self, jti: str, expires: float):
+        now = time.time()
+        for expired in [key for key, expiry in self.revoked.items() if expiry <= now]:
+            del self.revoked[expired]
+        self.revoked[jti] = expires
+
+    async def load(self):
+        """Restore generations and unexpired revocations after a restart"""
+        async for user in db.users.find({"session_generation": {"$gt": 1}}, {"session_generation": 1}):
+            self.generations[user["_id"]] = user["session_generation"]
+        async for revoked in db.revoked_sessions.find({"expires_at": {"$gt": datetime.now(timezone.utc)}}):
+            expires_at = revoked["expires_at"].replace(tzinfo=timezone.utc)
+            self.revoked[revoked["_id"]] = expires_at.timestamp()
+
+signed_sessions = SignedSessions()
+
+def is_signed_token(session_token: str) -> bool:
+    return SESSION_MODE == "signed" and session_token.startswith(SIGNED_TOKEN_PREFIX)
+
+# Auth service client, shared for the app's lifetime so logins reuse
+# pooled keep-alive connections instead of a fresh TCP+TLS handshake
+AUTH_SESSION_DATA_URL = os.environ.get(
+    'AUTH_SESSION_DATA_URL',
+    'https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data',
+)
+AUTH_RETRIES = int(os.environ.get('AUTH_RETRIES', '2'))
+AUTH_RETRY_BACKOFF = float(os.environ.get('AUTH_RETRY_BACKOFF', '0.2'))
+
+auth_http_client: Optional[httpx.AsyncClient] = None
+
+def create_auth_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(
+            float(os.environ.get('AUTH_READ_TIMEOUT', '10')),
+            connect=float(os.environ.get('AUTH_CONNECT_TIMEOUT', '5')),
+        ),
+        # Bounds concurrent calls; extra logins wait up to the pool timeout
+        limits=httpx.Limits(
+            max_connections=int(os.environ.get('AUTH_MAX_CONNECTIONS', '20')),
+            max_keepalive_connections=int(os.environ.get('AUTH_MAX_KEEPALIVE', '10')),
+            keepalive_expiry=30,
+        ),
+    )
+
+async def fetch_session_data(session_id: str) -> httpx.Response:
+    """GET the OAuth session data, retrying transport errors and 5xx with backoff"""
+    for attempt in range(AUTH_RETRIES + 1):
+        last_attempt = attempt == AUTH_RETRIES
+        try:
+            auth_response = await auth_http_client.get(
+                AUTH_SESSION_DATA_URL,
+                headers={"X-Session-ID": session_id}
+            )
+            if auth_response.status_code < 500 or last_attempt:
+                return auth_response
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        await asyncio.sleep(AUTH_RETRY_BACKOFF * 2 ** attempt)
 
 # Authentication helper functions
 async def get_session_token(request: Request) -> Optional[str]:
@@ -121,7 +870,18 @@ async def get_current_user(request: Request) -> Optional[User]:
     session_token = await get_session_token(request)
     if not session_token:
         return None
+    return await user_for_session(session_token)
+
+async def user_for_session(session_token: str) -> Optional[User]:
+    """User a session token belongs to; None once it is expired, revoked or logged out"""
+    if is_signed_token(session_token):
+        return signed_sessions.verify(session_token)
+    
+    cached_user = session_cache.get(session_token)
+    if cached_user:
+        return cached_user
     
+    generation = session_cache.generation
     # Check if session exists and is valid
     session = await db.user_sessions.find_one({
         "session_token": session_token,
@@ -139,11 +899,14 @@ async def get_current_user(request: Request) -> Optional[User]:
     # Map _id to id for Pydantic compatibility
     user_doc["id"] = user_doc["_id"]
     del user_doc["_id"]  # Remove _id to avoid conflicts
-    return User(**user_doc)
+    user = User(**user_doc)
+    session_cache.set(session_token, user, session["expires_at"], session.get("_id"), generation)
+    return user
 
 async def require_auth(request: Request) -> User:
     """Dependency to require authentication"""
-    user = await get_current_user(request)
+    with timed("auth"):
+        user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Authentication required")
     return user
@@ -168,16 +931,16 @@ async def create_session(request: Request, response: Response):
             raise HTTPException(status_code=400, detail="Session ID required")
         
         # Call Emergent auth service to get user data
-        async with httpx.AsyncClient() as client:
-            auth_response = await client.get(
-                "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-                headers={"X-Session-ID": session_id}
-            )
-            
-            if auth_response.status_code != 200:
-                raise HTTPException(status_code=400, detail="Invalid session ID")
-            
-            session_data = auth_response.json()
+        try:
+            auth_response = await fetch_session_data(session_id)
+        except httpx.HTTPError as e:
+            logger.error(f"Auth service request failed: {e!r}")
+            raise HTTPException(status_code=502, detail="Auth service unavailable")
+        
+        if auth_response.status_code != 200:
+            raise HTTPException(status_code=400, detail="Invalid session ID")
+        
+        session_data = auth_response.json()
         
         # Extract user info
         user_data = {
@@ -196,20 +959,33 @@ async def create_session(request: Request, response: Response):
             user_doc["_id"] = user_doc.pop("id")
             await db.users.insert_one(user_doc)
         
-        # Create new session
-        session_token = session_data["session_token"]
-        session_doc = {
-            "user_id": user_data["id"],
-            "session_token": session_token,
-            "expires_at": datetime.now(timezone.utc).replace(microsecond=0) + timedelta(days=7),
-            "created_at": datetime.now(timezone.utc)
-        }
-        
-        # Clean up existing sessions for this user
-        await db.user_sessions.delete_many({"user_id": user_data["id"]})
-        
-        # Insert new session
-        await db.user_sessions.insert_one(session_doc)
+        if SESSION_MODE == "signed":
+            # New generation retires the user's existing tokens
+            user_doc = await db.users.find_one_and_update(
+                {"_id": user_data["id"]},
+                {"$inc": {"session_generation": 1}},
+                return_document=ReturnDocument.AFTER,
+            )
+            session_token, _ = signed_sessions.issue(
+                {**user_data, "created_at": user_doc.get("created_at", user_data["created_at"])},
+                user_doc["session_generation"],
+            )
+        else:
+            # Create new session
+            session_token = session_data["session_token"]
+            session_doc = {
+                "user_id": user_data["id"],
+                "session_token": session_token,
+                "expires_at": datetime.now(timezone.utc).replace(microsecond=0) + SESSION_TTL,
+                "created_at": datetime.now(timezone.utc)
+            }
+            
+            # Clean up existing sessions for this user
+            session_cache.invalidate_user(user_data["id"])
+            await db.user_sessions.delete_many({"user_id": user_data["id"]})
+            
+            # Insert new session
+            await db.user_sessions.insert_one(session_doc)
         
         # Set httpOnly cookie
         response.set_cookie(
@@ -225,6 +1001,8 @@ async def create_session(request: Request, response: Response):
         # Return user data
         return {"user": user_data, "session_token": session_token}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Session creation error: {str(e)}")
         raise HTTPException(status_code=500, detail="Session creation failed")
@@ -233,8 +1011,21 @@ async def create_session(request: Request, response: Response):
 async def logout(request: Request, response: Response):
     """Logout user and clear session"""
     session_token = await get_session_token(request)
-    if session_token:
+    if session_token and is_signed_token(session_token):
+        payload = signed_sessions.decode(session_token)
+        if payload:
+            signed_sessions.revoke(payload["jti"], payload["exp"])
+            await db.revoked_sessions.update_one(
+                {"_id": payload["jti"]},
+                {"$set": {
+                    "user_id": payload["sub"],
+                    "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc),
+                }},
+                upsert=True,
+            )
+    elif session_token:
         # Delete session from database
+        session_cache.invalidate(session_token)
         await db.user_sessions.delete_many({"session_token": session_token})
     
     # Clear cookie
@@ -247,6 +1038,44 @@ async def logout(request: Request, response: Response):
     
     return {"message": "Logged out successfully"}
 
+@api_router.get("/auth/cache-stats")
+async def get_session_cache_stats():
+    """Session cache hit/miss counters"""
+    return session_cache.stats()
+
+@api_router.get("/metrics")
+async def get_metrics():
+    """Prometheus exposition of MongoDB, connection pool and route metrics"""
+    lines = []
+    for metric in (
+        http_requests, http_request_seconds,
+        mongo_command_seconds, mongo_command_failures,
+        mongo_pool_wait_seconds, mongo_pool_connections,
+    ):
+        lines.extend(metric.render())
+    
+    cache_stats = session_cache.stats()
+    for name in ("hits", "misses", "invalidations"):
+        lines.append(f"# TYPE session_cache_{name}_total counter")
+        lines.append(f"session_cache_{name}_total {cache_stats[name]}")
+    lines.append("# TYPE session_cache_size gauge")
+    lines.append(f"session_cache_size {cache_stats['size']}")
+    
+    event_stats = event_broker.stats()
+    lines.append("# TYPE event_streams gauge")
+    lines.append(f"event_streams {event_stats['streams']}")
+    lines.append("# TYPE event_stream_resyncs_total counter")
+    lines.append(f"event_stream_resyncs_total {event_stats['resyncs']}")
+    
+    if write_behind:
+        buffer_stats = write_behind.stats()
+        lines.append("# TYPE write_behind_pending gauge")
+        lines.append(f"write_behind_pending {buffer_stats['pending']}")
+        lines.append("# TYPE write_behind_flushed_total counter")
+        lines.append(f"write_behind_flushed_total {buffer_stats['flushed']}")
+    
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
@@ -264,155 +1093,2147 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+@api_router.get("/indexes/explain")
+async def get_index_report(request: Request, date: Optional[str] = None):
+    """Show the query plan of every route to prove none of them scans"""
+    user = await require_auth(request)
+    
+    plans = await explain_route_queries(user.id, date or datetime.now(timezone.utc).date().isoformat())
+    return {
+        "collection_scans": [plan["route"] for plan in plans if plan["collection_scan"]],
+        "plans": plans,
+    }
+
+# Date range helpers
+def _query_date(value: str) -> str:
+    try:
+        return normalize_date(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def date_range_query(user_id: str, date: Optional[str], date_from: Optional[str], date_to: Optional[str]) -> dict:
+    """Match a user's records on one date or an inclusive date range"""
+    query = {"user_id": user_id}
+    if date:
+        query["date"] = _query_date(date)
+    elif date_from or date_to:
+        query["date"] = {}
+        if date_from:
+            query["date"]["$gte"] = _query_date(date_from)
+        if date_to:
+            query["date"]["$lte"] = _query_date(date_to)
+    return query
+
+# Keyset pagination helpers
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+
+def encode_page_cursor(record: dict) -> str:
+    """Opaque token pointing just past a record in PAGE_SORT order"""
+    created_at = record.get("created_at")
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    key = [record.get("date"), created_at, record.get("id")]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_page_cursor(cursor: str) -> dict:
+    """Turn a page token into a query for records strictly after it"""
+    try:
+        date, created_at, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    
+    return {"$or": [
+        {"date": {"$gt": date}},
+        {"date": date, "created_at": {"$gt": created_at}},
+        {"date": date, "created_at": created_at, "id": {"$gt": record_id}},
+    ]}
+
+async def find_page(collection, query: dict, limit: Optional[int], cursor: Optional[str]) -> dict:
+    """Fetch one keyset page of records and the token for the next one"""
+    limit = limit or DEFAULT_PAGE_SIZE
+    if cursor:
+        query = {**query, **decode_page_cursor(cursor)}
+    
+    records = await collection.find(query, {"_id": 0}).sort(PAGE_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_page_cursor(records[-1])
+    return {"items": records, "next": next_cursor}
+
+# Effective fuel-rate index
+class RateIndex:
+    """Per-user sorted rate history answering "rate in force on date X" by bisection"""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        # user_id -> fuel_type -> (sorted (date, created_at) keys, matching rate records)
+        self._users: "OrderedDict[str, dict]" = OrderedDict()
+        # user_id -> [loads in flight, changes since]; a history read from
+        # the database is only cached if no rate changed while it was read
+        self._loading = {}
+        self.hits = 0
+        self.loads = 0
+
+    async def _history(self, user_id: str) -> dict:
+        history = self._users.get(user_id)
+        if history is not None:
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return history
+
+        self.loads += 1
+        loading = self._loading.setdefault(user_id, [0, 0])
+        loading[0] += 1
+        changes = loading[1]
+        history = {}
+        try:
+            cursor = db.fuel_rates.find(
+                {"user_id": user_id},
+                {"_id": 0, "id": 1, "fuel_type": 1, "date": 1, "rate": 1, "created_at": 1},
+            ).sort(RATE_HISTORY_SORT)
+            async for rate in cursor:
+                keys, rates = history.setdefault(rate["fuel_type"], ([], []))
+                keys.append((rate["date"], rate["created_at"]))
+                rates.append(rate)
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[user_id]
+        if loading[1] != changes:
+            # A rate written mid-read may be missing; the next lookup reloads
+            return history
+        # Another request may have loaded this user while we awaited the cursor
+        history = self._users.setdefault(user_id, history)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return history
+
+    def add(self, rate: dict):
+        """Record a newly written rate for a user whose history is loaded"""
+        self._changed(rate["user_id"])
+        history = self._users.get(rate["user_id"])
+        if history is None:
+            return
+        keys, rates = history.setdefault(rate["fuel_type"], ([], []))
+        created_at = rate["created_at"].replace(tzinfo=None)  # match Motor's naive UTC
+        key = (rate["date"], created_at)
+        position = bisect.bisect_right(keys, key)
+        keys.insert(position, key)
+        rates.insert(position, {**rate, "created_at": created_at})
+
+    def invalidate_user(self, user_id: str):
+        self._changed(user_id)
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        for loading in self._loading.values():
+            loading[1] += 1
+        self._users.clear()
+
+    def _changed(self, user_id: str):
+        loading = self._loading.get(user_id)
+        if loading:
+            loading[1] += 1
+
+    async def effective(self, user_id: str, date: str) -> dict:
+        """Rate record in force on a date for every fuel type that has one"""
+        history = await self._history(user_id)
+        effective = {}
+        for fuel_type, (keys, rates) in history.items():
+            # Everything on or before the date sorts below (date, <any later time>)
+            position = bisect.bisect_left(keys, (date, datetime.max))
+            if position:
+                effective[fuel_type] = rates[position - 1]
+        return effective
+
+rate_index = RateIndex(max_users=int(os.environ.get('RATE_INDEX_USERS', '1000')))
+
+# Nozzle meter state
+def _nozzle_reading(sale: dict) -> dict:
+    # Stored as BSON dates: naive UTC at millisecond precision
+    created_at = sale["created_at"].replace(tzinfo=None)
+    created_at = created_at.replace(microsecond=created_at.microsecond // 1000 * 1000)
+    return {
+        "nozzle_id": sale["nozzle_id"],
+        "fuel_type": sale["fuel_type"],
+        "closing_reading": sale["closing_reading"],
+        "date": sale["date"],
+        "created_at": created_at,
+        "sale_id": sale["id"],
+    }
+
+def _reading_order(reading: dict) -> tuple:
+    return reading["date"], reading["created_at"]
+
+class NozzleReadings:
+    """Last closing reading per (user, nozzle), kept in nozzle_readings and cached per user"""
+
+    def __init__(self, max_users: int = 1000):
+        self.max_users = max_users
+        # user_id -> nozzle_id -> reading
+        self._users: "OrderedDict[str, dict]" = OrderedDict()
+        # user_id -> [loads in flight, changes since], as in RateIndex
+        self._loading = {}
+
+    async def get(self, user_id: str) -> dict:
+        readings = self._users.get(user_id)
+        if readings is not None:
+            self._users.move_to_end(user_id)
+            return readings
+        
+        loading = self._loading.setdefault(user_id, [0, 0])
+        loading[0] += 1
+        changes = loading[1]
+        try:
+            cursor = db.nozzle_readings.find({"user_id": user_id}, {"_id": 0, "user_id": 0})
+            readings = {reading["nozzle_id"]: reading async for reading in cursor}
+        finally:
+            loading[0] -= 1
+            if not loading[0]:
+                del self._loading[user_id]
+        if loading[1] != changes:
+            # A sale written mid-read may be missing; the next call reloads
+            return readings
+        # Another request may have loaded this user while we awaited the cursor
+        readings = self._users.setdefault(user_id, readings)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return readings
+
+    async def record_sales(self, sales: List[dict]):
+        """Advance nozzle state for newly written sales; an older reading never replaces a newer one"""
+        latest = {}
+        for sale in sales:
+            reading = _nozzle_reading(sale)
+            key = (sale["user_id"], sale["nozzle_id"])
+            if key not in latest or _reading_order(reading) >= _reading_order(latest[key]):
+                latest[key] = reading
+        if not latest:
+            return
+        
+        operations = [
+            UpdateOne(
+                {
+                    "user_id": user_id,
+                    "nozzle_id": nozzle_id,
+                    "$or": [
+                        {"date": {"$lt": reading["date"]}},
+                        {"date": reading["date"], "created_at": {"$lte": reading["created_at"]}},
+                    ],
+                },
+                {"$set": reading},
+                upsert=True,
+            )
+            for (user_id, nozzle_id), reading in latest.items()
+        ]
+        try:
+            await db.nozzle_readings.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # The filter missed because a newer reading is stored, and the
+            # upsert then hit the unique index: nothing to do
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        
+        for (user_id, nozzle_id), reading in latest.items():
+            self._changed(user_id)
+            readings = self._users.get(user_id)
+            if readings is None:
+                continue
+            current = readings.get(nozzle_id)
+            if current is None or _reading_order(reading) >= _reading_order(current):
+                readings[nozzle_id] = reading
+
+    def apply(self, document: dict):
+        """Take a stored reading written elsewhere into the cache of a loaded user"""
+        self._changed(document["user_id"])
+        readings = self._users.get(document["user_id"])
+        if readings is None:
+            return
+        reading = {field: value for field, value in document.items() if field not in ("_id", "user_id")}
+        current = readings.get(reading["nozzle_id"])
+        if current is None or _reading_order(reading) >= _reading_order(current):
+            readings[reading["nozzle_id"]] = reading
+
+    def invalidate_user(self, user_id: str):
+        self._changed(user_id)
+        self._users.pop(user_id, None)
+
+    def clear(self):
+        for loading in self._loading.values():
+            loading[1] += 1
+        self._users.clear()
+
+    def _changed(self, user_id: str):
+        loading = self._loading.get(user_id)
+        if loading:
+            loading[1] += 1
+
+nozzle_readings = NozzleReadings(max_users=int(os.environ.get('NOZZLE_CACHE_USERS', '1000')))
+
+async def rebuild_nozzle_readings(user_id: Optional[str] = None) -> int:
+    """Recompute nozzle_readings from fuel_sales (backfill, or after a restore)"""
+    query = {"user_id": user_id} if user_id else {}
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"date": 1, "created_at": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "nozzle_id": "$nozzle_id"},
+            "fuel_type": {"$last": "$fuel_type"},
+            "closing_reading": {"$last": "$closing_reading"},
+            "date": {"$last": "$date"},
+            "created_at": {"$last": "$created_at"},
+            "sale_id": {"$last": "$id"},
+        }},
+    ]
+    readings = []
+    async for group in db.fuel_sales.aggregate(pipeline, allowDiskUse=True):
+        key = group.pop("_id")
+        readings.append({**key, **group})
+    
+    await db.nozzle_readings.delete_many(query)
+    if readings:
+        await db.nozzle_readings.insert_many(readings, ordered=False)
+    if user_id:
+        nozzle_readings.invalidate_user(user_id)
+    else:
+        nozzle_readings.clear()
+    return len(readings)
+
+# Record versions
+class RecordVersions:
+    """Per (user, collection, date) change counters behind the list ETags
+
+    Every write bumps the counter of each date it touches. Dates never
+    written since the feature shipped are version 0, so migrations that
+    rewrite records in place start a new epoch instead, which changes
+    every ETag at once.
+    """
+
+    EPOCH_ID = "epoch"
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        # (user_id, collection, date) -> version
+        self._versions: "OrderedDict[tuple, int]" = OrderedDict()
+        # Local invalidations so far; a version read from the database
+        # is only cached if none happened while it was being read
+        self._invalidations = 0
+        self.epoch = 0
+
+    async def load_epoch(self):
+        document = await db.record_versions.find_one({"_id": self.EPOCH_ID})
+        self.epoch = document["epoch"] if document else 0
+
+    async def new_epoch(self):
+        """Invalidate every ETag, after records were changed outside the write routes"""
+        document = await db.record_versions.find_one_and_update(
+            {"_id": self.EPOCH_ID},
+            {"$inc": {"epoch": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        self.epoch = document["epoch"]
+        self.clear()
+
+    async def get(self, user_id: str, collection_name: str, date: str) -> int:
+        key = (user_id, collection_name, date)
+        version = self._versions.get(key)
+        if version is not None:
+            self._versions.move_to_end(key)
+            return version
+        
+        invalidations = self._invalidations
+        document = await db.record_versions.find_one(
+            {"user_id": user_id, "collection": collection_name, "date": date}, {"version": 1}
+        )
+        version = document["version"] if document else 0
+        if invalidations == self._invalidations:
+            self._versions[key] = version
+            while len(self._versions) > self.maxsize:
+                self._versions.popitem(last=False)
+        return version
+
+    async def bump(self, keys):
+        """Advance the version of each (user_id, collection, date) written to"""
+        keys = set(keys)
+        if not keys:
+            return
+        operations = [
+            UpdateOne(
+                {"user_id": user_id, "collection": collection_name, "date": date},
+                {"$inc": {"version": 1}},
+                upsert=True,
+            )
+            for user_id, collection_name, date in keys
+        ]
+        try:
+            await db.record_versions.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # Two first writes to a date raced to insert its counter; the
+            # loser's increment now matches the winner's document
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            await db.record_versions.bulk_write([operations[error["index"]] for error in errors], ordered=False)
+        for key in keys:
+            self.invalidate(key)
+
+    def invalidate(self, key: tuple):
+        self._versions.pop(key, None)
+        self._invalidations += 1
+
+    def clear(self):
+        self._versions.clear()
+        self._invalidations += 1
+
+    def etag(self, user_id: str, collection_name: str, date: str, version: int) -> str:
+        # Versions are per user and mostly 0, so the tag must name the user
+        # or a browser shared by two accounts would revalidate one's copy
+        # with the other's tag
+        user = hmac.new(SESSION_SECRET.encode(), user_id.encode(), hashlib.sha256).hexdigest()[:16]
+        return f'"{user}.{collection_name}.{date}.{self.epoch}.{version}"'
+
+record_versions = RecordVersions(maxsize=int(os.environ.get('RECORD_VERSION_CACHE_SIZE', '100000')))
+
+def _record_version_keys(collection_name: str, documents: List[dict]):
+    return {(document["user_id"], collection_name, document["date"]) for document in documents}
+
+def _if_none_match(request: Request) -> set:
+    header = request.headers.get("if-none-match", "")
+    # Weak comparison: proxies that re-encode the body weaken the tag
+    return {tag.strip().removeprefix("W/") for tag in header.split(",") if tag.strip()}
+
+async def check_list_etag(request: Request, user_id: str, collection_name: str, date: str) -> tuple:
+    """ETag headers for a one-date list, and a 304 response if the client's copy is current"""
+    version = await record_versions.get(user_id, collection_name, date)
+    etag = record_versions.etag(user_id, collection_name, date, version)
+    if wants_msgpack(request):
+        etag = etag[:-1] + '.msgpack"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept, Authorization, Cookie"}
+    tags = _if_none_match(request)
+    if etag in tags or "*" in tags:
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
+
+# Daily summary rollups
+def _summary_key(name: str) -> str:
+    """Make a fuel type or category safe to use as a MongoDB field name"""
+    return (name or "_").replace(".", "_").replace("$", "_")
+
+def _add(counters: dict, field: str, value):
+    counters[field] = counters.get(field, 0) + value
+
+def summary_updates(collection_name: str, documents: List[dict]) -> dict:
+    """Fold inserted records into $inc/$set updates per (user_id, date)"""
+    updates = {}
+    for document in documents:
+        key = (document["user_id"], document["date"])
+        update = updates.setdefault(key, {"$inc": {}, "$set": {}})
+        inc = update["$inc"]
+        
+        if collection_name == "fuel_sales":
+            prefix = f"fuel.{_summary_key(document['fuel_type'])}"
+            update["$set"][f"{prefix}.fuel_type"] = document["fuel_type"]
+            _add(inc, f"{prefix}.liters", document["liters"])
+            _add(inc, f"{prefix}.amount", document["amount"])
+            _add(inc, f"{prefix}.count", 1)
+            _add(inc, "totals.fuel_liters", document["liters"])
+            _add(inc, "totals.fuel_amount", document["amount"])
+        elif collection_name == "credit_sales":
+            _add(inc, "credit.amount", document["amount"])
+            _add(inc, "credit.count", 1)
+            _add(inc, "totals.credit_amount", document["amount"])
+        elif collection_name == "income_expenses" and document["type"] in ("income", "expense"):
+            prefix = f"{document['type']}.{_summary_key(document['category'])}"
+            update["$set"][f"{prefix}.category"] = document["category"]
+            _add(inc, f"{prefix}.amount", document["amount"])
+            _add(inc, f"{prefix}.count", 1)
+            _add(inc, f"totals.{document['type']}_amount", document["amount"])
+    return updates
+
+async def apply_summary_updates(updates: dict):
+    operations = []
+    for (user_id, date), update in updates.items():
+        if not update["$inc"]:
+            continue
+        if not update["$set"]:
+            del update["$set"]
+        operations.append(UpdateOne({"user_id": user_id, "date": date}, update, upsert=True))
+    if operations:
+        await db.daily_summaries.bulk_write(operations, ordered=False)
+
+async def on_records_inserted(collection_name: str, documents: List[dict]):
+    """Keep derived data current after records are written"""
+    await record_versions.bump(_record_version_keys(collection_name, documents))
+    if collection_name in ("fuel_sales", "credit_sales", "income_expenses"):
+        await apply_summary_updates(summary_updates(collection_name, documents))
+    if collection_name == "fuel_sales":
+        await nozzle_readings.record_sales(documents)
+    elif collection_name == "fuel_rates":
+        for document in documents:
+            rate_index.add(document)
+    if not MULTI_WORKER:
+        # Across workers, events come from the change stream instead
+        event_broker.publish_records(collection_name, documents)
+
+def _merge_summary_updates(target: dict, updates: dict):
+    for key, update in updates.items():
+        merged = target.setdefault(key, {"$inc": {}, "$set": {}})
+        merged["$set"].update(update["$set"])
+        for field, value in update["$inc"].items():
+            _add(merged["$inc"], field, value)
+
+async def rebuild_daily_summaries(user_id: Optional[str] = None) -> int:
+    """Recompute daily_summaries from the raw collections (backfill)"""
+    query = {"user_id": user_id} if user_id else {}
+    await db.daily_summaries.delete_many(query)
+    
+    updates = {}
+    for collection_name in ("fuel_sales", "credit_sales", "income_expenses"):
+        batch = []
+        async for document in db[collection_name].find(query, {"_id": 0}):
+            batch.append(document)
+            if len(batch) >= 1000:
+                _merge_summary_updates(updates, summary_updates(collection_name, batch))
+                batch = []
+        _merge_summary_updates(updates, summary_updates(collection_name, batch))
+    
+    await apply_summary_updates(updates)
+    return len(updates)
+
+async def migrate_record_dates() -> dict:
+    """Rewrite non-canonical record dates as YYYY-MM-DD (one-off migration)"""
+    report = {}
+    for collection_name in DATA_COLLECTIONS:
+        updated = 0
+        unparseable = 0
+        operations = []
+        cursor = db[collection_name].find({"date": {"$not": CANONICAL_DATE}}, {"_id": 1, "date": 1})
+        async for document in cursor:
+            try:
+                canonical_date = normalize_date(document.get("date"))
+            except ValueError:
+                logger.warning(f"{collection_name} {document['_id']}: unparseable date {document.get('date')!r}")
+                unparseable += 1
+                continue
+            operations.append(UpdateOne({"_id": document["_id"]}, {"$set": {"date": canonical_date}}))
+            if len(operations) >= 1000:
+                updated += (await db[collection_name].bulk_write(operations, ordered=False)).modified_count
+                operations = []
+        if operations:
+            updated += (await db[collection_name].bulk_write(operations, ordered=False)).modified_count
+        report[collection_name] = {"updated": updated, "unparseable": unparseable}
+    
+    if any(counts["updated"] for counts in report.values()):
+        # Rollups and nozzle state are keyed by date, so recompute them in canonical form
+        await rebuild_daily_summaries()
+        await rebuild_nozzle_readings()
+        await record_versions.new_epoch()
+    return report
+
+async def backfill_updated_at() -> dict:
+    """Give records written before delta sync an updated_at (one-off migration)"""
+    report = {}
+    for collection_name in DATA_COLLECTIONS:
+        result = await db[collection_name].update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": "$created_at"}}],
+        )
+        report[collection_name] = result.modified_count
+    if any(report.values()):
+        await record_versions.new_epoch()
+    return report
+
+# Write-behind buffer
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes')
+WRITE_BEHIND_DIR = Path(os.environ.get('WRITE_BEHIND_DIR', str(ROOT_DIR / 'write_behind')))
+WRITE_BEHIND_FLUSH_MS = int(os.environ.get('WRITE_BEHIND_FLUSH_MS', '50'))
+WRITE_BEHIND_BATCH = int(os.environ.get('WRITE_BEHIND_BATCH', '500'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_ENQUEUE_TIMEOUT', '2'))
+
+RECORD_MODELS = {
+    "fuel_sales": FuelSale,
+    "credit_sales": CreditSale,
+    "income_expenses": IncomeExpense,
+    "fuel_rates": FuelRate,
+}
+
+class WriteBehindBuffer:
+    """Acknowledge creates once journaled, then write them in insert_many batches
+
+    Each worker appends to its own journal file and fsyncs it once per group
+    of concurrent requests. Documents are flushed to MongoDB every
+    flush_interval seconds or as soon as batch_size are waiting, and the
+    journal is truncated whenever everything acknowledged has been written.
+    Journals left behind by a crashed worker are replayed on startup; the
+    unique (user_id, id) index turns any re-inserted record into a no-op.
+    """
+
+    def __init__(self, directory: Path, batch_size: int, flush_interval: float,
+                 max_pending: int, enqueue_timeout: float):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.pending = 0  # acknowledged (or being journaled) but not yet in MongoDB
+        self.flushed = 0
+        self._buffers = {name: [] for name in RECORD_MODELS}
+        self._queued_ids = {name: set() for name in RECORD_MODELS}  # (user_id, id) of pending records
+        self._to_journal = []  # (collection name, documents, future)
+        self._journal_ready = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._space = asyncio.Condition()
+        self._journal = None
+        self._journal_path = None
+        self._tasks = []
+        self._closing = False
+
+    async def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # Unique per start: a restarted worker can reuse a crashed one's PID,
+        # and must replay that journal rather than append to it
+        self._journal_path = self.directory / f"journal-{os.getpid()}-{uuid.uuid4().hex[:8]}.ndjson"
+        self._journal = open(self._journal_path, "xb")
+        fcntl.flock(self._journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        await self._replay_orphaned_journals()
+        self._tasks = [
+            asyncio.create_task(self._journal_loop()),
+            asyncio.create_task(self._flush_loop()),
+        ]
+
+    async def stop(self):
+        """Flush everything still buffered; keep the journal if that fails"""
+        self._closing = True
+        self._journal_ready.set()
+        self._flush_now.set()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._write_journal_batch()
+        try:
+            await self._flush_all()
+        except Exception as e:
+            logger.error(f"Write-behind flush on shutdown failed, journal kept for replay: {str(e)}")
+        self._journal.close()
+        if self.pending == 0:
+            self._journal_path.unlink(missing_ok=True)
+
+    async def enqueue(self, collection_name: str, documents: List[dict], client_ids: set) -> set:
+        """Return once the documents are durably journaled; 503 if the buffer stays full
+
+        Documents whose id is already stored or pending are not journaled;
+        their indexes are returned so the caller can reject them. Only the
+        indexes in client_ids, whose id the client chose, are looked up in
+        MongoDB: generated uuid4 ids cannot collide with a stored record.
+        """
+        stored = await self._stored_ids(collection_name, [documents[index] for index in client_ids])
+        queued = self._queued_ids[collection_name]
+        duplicates, accepted, keys = set(), [], []
+        for index, document in enumerate(documents):
+            key = (document["user_id"], document["id"])
+            if key in stored or key in queued:
+                duplicates.add(index)
+                continue
+            queued.add(key)  # reserved before any await, so concurrent requests see it
+            keys.append(key)
+            accepted.append(document)
+        if not accepted:
+            return duplicates
+        
+        count = len(accepted)
+        try:
+            async with self._space:
+                try:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self.pending == 0 or self.pending + count <= self.max_pending),
+                        self.enqueue_timeout,
+                    )
+                except asyncio.TimeoutError:
+                    raise HTTPException(
+                        status_code=503,
+                        detail="Write queue is full, retry shortly",
+                        headers={"Retry-After": "1"},
+                    )
+                self.pending += count
+            
+            future = asyncio.get_running_loop().create_future()
+            self._to_journal.append((collection_name, accepted, future))
+            self._journal_ready.set()
+            await future
+        except HTTPException:
+            queued.difference_update(keys)
+            raise
+        return duplicates
+
+    async def _stored_ids(self, collection_name: str, documents: List[dict]) -> set:
+        """(user_id, id) of the documents that are already in MongoDB"""
+        if not documents:
+            return set()
+        ids_by_user = {}
+        for document in documents:
+            ids_by_user.setdefault(document["user_id"], []).append(document["id"])
+        stored = set()
+        for user_id, ids in ids_by_user.items():
+            async for document in db[collection_name].find({"user_id": user_id, "id": {"$in": ids}}, {"_id": 0, "id": 1}):
+                stored.add((user_id, document["id"]))
+        return stored
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "flushed": self.flushed,
+            "buffered": {name: len(buffer) for name, buffer in self._buffers.items()},
+        }
+
+    async def _journal_loop(self):
+        while not self._closing:
+            await self._journal_ready.wait()
+            self._journal_ready.clear()
+            await self._write_journal_batch()
+
+    async def _write_journal_batch(self):
+        batch, self._to_journal = self._to_journal, []
+        if not batch:
+            return
+        data = b"".join(
+            _dumps({"collection": collection_name, "document": document}) + b"\n"
+            for collection_name, documents, _ in batch
+            for document in documents
+        )
+        try:
+            await asyncio.to_thread(self._append_to_journal, data)
+        except OSError as e:
+            logger.error(f"Write-behind journal write failed: {str(e)}")
+            await self._release(sum(len(documents) for _, documents, _ in batch))
+            for _, _, future in batch:
+                future.set_exception(HTTPException(status_code=503, detail="Write queue unavailable"))
+            return
+        
+        for collection_name, documents, future in batch:
+            self._buffers[collection_name].extend(documents)
+            future.set_result(None)
+        if any(len(buffer) >= self.batch_size for buffer in self._buffers.values()):
+            self._flush_now.set()
+
+    def _append_to_journal(self, data: bytes):
+        self._journal.write(data)
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            try:
+                await self._flush_all()
+            except Exception as e:
+                # Documents stay buffered and journaled; retried on the next tick
+                logger.error(f"Write-behind flush failed: {str(e)}")
+
+    async def _flush_all(self):
+        for collection_name, buffer in self._buffers.items():
+            while buffer:
+                batch = buffer[:self.batch_size]
+                await self._insert_batch(collection_name, batch)
+                del buffer[:len(batch)]
+                self._queued_ids[collection_name].difference_update(
+                    (document["user_id"], document["id"]) for document in batch
+                )
+                self.flushed += len(batch)
+                await self._release(len(batch))
+        if self.pending == 0 and self._journal and self._journal.tell() > 0:
+            # Nothing is mid-journal while pending is zero, so this cannot drop a write
+            self._journal.truncate(0)
+            self._journal.seek(0)
+
+    async def _insert_batch(self, collection_name: str, documents: List[dict]):
+        # insert_many gives each document an _id, so those that already have
+        # one were sent by a failed attempt and may have been written by it
+        retried = {index for index, document in enumerate(documents) if "_id" in document}
+        # Stamp the time the record actually lands: delta sync only looks
+        # SYNC_SETTLE_SECONDS back, and a retried or replayed batch can be later
+        now = datetime.now(timezone.utc)
+        for document in documents:
+            document["updated_at"] = now
+        inserted = documents
+        try:
+            await db[collection_name].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == 11000 and error["index"] in retried:
+                    continue
+                failed.add(error["index"])
+                if error.get("code") == 11000:
+                    # Expected for a replayed journal whose records were already
+                    # flushed; otherwise a write that raced enqueue's id check
+                    logger.warning(f"Write-behind insert into {collection_name} skipped a duplicate id: {error.get('errmsg')}")
+                else:
+                    logger.error(f"Write-behind insert into {collection_name} dropped a record: {error.get('errmsg')}")
+            inserted = [document for index, document in enumerate(documents) if index not in failed]
+        await on_records_inserted(collection_name, inserted)
+
+    async def _release(self, count: int):
+        async with self._space:
+            self.pending -= count
+            self._space.notify_all()
+
+    async def _replay_orphaned_journals(self):
+        """Adopt the records of journals whose worker is gone"""
+        for path in sorted(self.directory.glob("journal-*.ndjson")):
+            if path == self._journal_path:
+                continue
+            with open(path, "rb") as journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # owned by a live worker
+                lines = []
+                for line in journal:
+                    try:
+                        entry = orjson.loads(line)
+                    except orjson.JSONDecodeError:
+                        continue  # torn final line; that request was never acknowledged
+                    model = RECORD_MODELS[entry["collection"]]
+                    document = model(**entry["document"]).dict()
+                    self._buffers[entry["collection"]].append(document)
+                    self._queued_ids[entry["collection"]].add((document["user_id"], document["id"]))
+                    lines.append(line.rstrip(b"\n") + b"\n")
+                # Copy into this worker's journal before the old one goes away
+                self._append_to_journal(b"".join(lines))
+                self.pending += len(lines)
+            logger.info(f"Replaying {len(lines)} write-behind records from {path.name}")
+            path.unlink()
+        self._flush_now.set()
+
+write_behind: Optional[WriteBehindBuffer] = None
+
+DUPLICATE_RECORD_ID = "A record with this id already exists"
+
+async def insert_record(collection_name: str, document: dict, client_id: bool = False):
+    """Write one record now, or hand it to the write-behind buffer
+
+    client_id says the id came from the request body rather than the
+    model's uuid4 default, so it may already be stored.
+    """
+    # updated_at drives delta sync, so it is never taken from the request body
+    document["updated_at"] = datetime.now(timezone.utc)
+    if write_behind:
+        if await write_behind.enqueue(collection_name, [document], {0} if client_id else set()):
+            raise HTTPException(status_code=409, detail=DUPLICATE_RECORD_ID)
+        return
+    try:
+        await db[collection_name].insert_one(document)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail=DUPLICATE_RECORD_ID)
+    await on_records_inserted(collection_name, [document])
+
+# Bulk ingest helpers
+MAX_BULK_ITEMS = 1000
+
+async def bulk_insert(collection, model, user: User, items: List[dict]) -> dict:
+    """Validate items in one pass and write the valid ones with an unordered insert_many"""
+    if len(items) > MAX_BULK_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_ITEMS} items per request")
+    
+    results = []
+    documents = []
+    positions = []  # results index of each document passed to insert_many
+    client_ids = set()  # indexes into documents whose id came from the item
+    now = datetime.now(timezone.utc)
+    with timed("model"):
+        for index, item in enumerate(items):
+            try:
+                record = model(**{**item, "user_id": user.id})
+            except ValidationError as e:
+                errors = [{"loc": list(error["loc"]), "msg": error["msg"]} for error in e.errors()]
+                results.append({"index": index, "status": "invalid", "errors": errors})
+                continue
+            results.append({"index": index, "status": "created", "id": record.id})
+            if "id" in item:
+                client_ids.add(len(documents))
+            documents.append({**record.dict(), "updated_at": now})  # server-maintained, like insert_record
+            positions.append(index)
+    
+    if documents and write_behind:
+        for index in await write_behind.enqueue(collection.name, documents, client_ids):
+            result = results[positions[index]]
+            result["status"] = "failed"
+            result["errors"] = [{"msg": DUPLICATE_RECORD_ID}]
+    elif documents:
+        failed = set()
+        try:
+            await collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                result = results[positions[error["index"]]]
+                result["status"] = "failed"
+                result["errors"] = [{"msg": error.get("errmsg", "write failed")}]
+        await on_records_inserted(
+            collection.name,
+            [document for index, document in enumerate(documents) if index not in failed],
+        )
+    
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
 # Petrol Pump Data Routes (Protected)
 @api_router.get("/fuel-sales")
-async def get_fuel_sales(request: Request, date: Optional[str] = None):
-    """Get fuel sales for a specific date"""
+async def get_fuel_sales(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get fuel sales for a specific date or from/to range, paged when limit or cursor is given"""
     user = await require_auth(request)
     
-    query = {"user_id": user.id}
+    query = date_range_query(user.id, date, date_from, date_to)
+    
+    if limit or cursor:
+        return negotiated_response(request, await find_page(db.fuel_sales, query, limit, cursor))
+    
+    headers = None
     if date:
-        query["date"] = date
+        headers, not_modified = await check_list_etag(request, user.id, "fuel_sales", query["date"])
+        if not_modified:
+            return not_modified
     
-    sales = await db.fuel_sales.find(query).to_list(1000)
-    # Remove MongoDB _id field to avoid serialization issues
-    for sale in sales:
-        if "_id" in sale:
-            del sale["_id"]
-    return sales
+    # Project out MongoDB _id, which is not JSON serializable
+    sales = await db.fuel_sales.find(query, {"_id": 0}).to_list(1000)
+    return negotiated_response(request, sales, headers)
 
 @api_router.post("/fuel-sales")
 async def create_fuel_sale(request: Request, sale_data: dict):
     """Create new fuel sale record"""
     user = await require_auth(request)
     
-    sale = FuelSale(
-        user_id=user.id,
-        **sale_data
-    )
+    with timed("model"):
+        sale = FuelSale(
+            user_id=user.id,
+            **sale_data
+        )
     
-    await db.fuel_sales.insert_one(sale.dict())
+    await insert_record("fuel_sales", sale.dict(), client_id="id" in sale_data)
     return {"message": "Fuel sale created", "id": sale.id}
 
+@api_router.post("/fuel-sales/bulk")
+async def create_fuel_sales_bulk(request: Request, items: List[dict]):
+    """Create many fuel sale records in one request"""
+    user = await require_auth(request)
+    
+    return await bulk_insert(db.fuel_sales, FuelSale, user, items)
+
 @api_router.get("/credit-sales")
-async def get_credit_sales(request: Request, date: Optional[str] = None):
-    """Get credit sales for a specific date"""
+async def get_credit_sales(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get credit sales for a specific date or from/to range, paged when limit or cursor is given"""
     user = await require_auth(request)
     
-    query = {"user_id": user.id}
+    query = date_range_query(user.id, date, date_from, date_to)
+    
+    if limit or cursor:
+        return negotiated_response(request, await find_page(db.credit_sales, query, limit, cursor))
+    
+    headers = None
     if date:
-        query["date"] = date
+        headers, not_modified = await check_list_etag(request, user.id, "credit_sales", query["date"])
+        if not_modified:
+            return not_modified
     
-    sales = await db.credit_sales.find(query).to_list(1000)
-    # Remove MongoDB _id field to avoid serialization issues
-    for sale in sales:
-        if "_id" in sale:
-            del sale["_id"]
-    return sales
+    # Project out MongoDB _id, which is not JSON serializable
+    sales = await db.credit_sales.find(query, {"_id": 0}).to_list(1000)
+    return negotiated_response(request, sales, headers)
 
 @api_router.post("/credit-sales")
 async def create_credit_sale(request: Request, sale_data: dict):
     """Create new credit sale record"""
     user = await require_auth(request)
     
-    sale = CreditSale(
-        user_id=user.id,
-        **sale_data
-    )
+    with timed("model"):
+        sale = CreditSale(
+            user_id=user.id,
+            **sale_data
+        )
     
-    await db.credit_sales.insert_one(sale.dict())
+    await insert_record("credit_sales", sale.dict(), client_id="id" in sale_data)
     return {"message": "Credit sale created", "id": sale.id}
 
+@api_router.post("/credit-sales/bulk")
+async def create_credit_sales_bulk(request: Request, items: List[dict]):
+    """Create many credit sale records in one request"""
+    user = await require_auth(request)
+    
+    return await bulk_insert(db.credit_sales, CreditSale, user, items)
+
 @api_router.get("/income-expenses")
-async def get_income_expenses(request: Request, date: Optional[str] = None):
-    """Get income/expense records for a specific date"""
+async def get_income_expenses(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get income/expense records for a specific date or from/to range, paged when limit or cursor is given"""
     user = await require_auth(request)
     
-    query = {"user_id": user.id}
+    query = date_range_query(user.id, date, date_from, date_to)
+    
+    if limit or cursor:
+        return negotiated_response(request, await find_page(db.income_expenses, query, limit, cursor))
+    
+    headers = None
     if date:
-        query["date"] = date
+        headers, not_modified = await check_list_etag(request, user.id, "income_expenses", query["date"])
+        if not_modified:
+            return not_modified
     
-    records = await db.income_expenses.find(query).to_list(1000)
-    # Remove MongoDB _id field to avoid serialization issues
-    for record in records:
-        if "_id" in record:
-            del record["_id"]
-    return records
+    # Project out MongoDB _id, which is not JSON serializable
+    records = await db.income_expenses.find(query, {"_id": 0}).to_list(1000)
+    return negotiated_response(request, records, headers)
 
 @api_router.post("/income-expenses")
 async def create_income_expense(request: Request, record_data: dict):
     """Create new income/expense record"""
     user = await require_auth(request)
     
-    record = IncomeExpense(
-        user_id=user.id,
-        **record_data
-    )
+    with timed("model"):
+        record = IncomeExpense(
+            user_id=user.id,
+            **record_data
+        )
     
-    await db.income_expenses.insert_one(record.dict())
+    await insert_record("income_expenses", record.dict(), client_id="id" in record_data)
     return {"message": "Income/expense record created", "id": record.id}
 
+@api_router.post("/income-expenses/bulk")
+async def create_income_expenses_bulk(request: Request, items: List[dict]):
+    """Create many income/expense records in one request"""
+    user = await require_auth(request)
+    
+    return await bulk_insert(db.income_expenses, IncomeExpense, user, items)
+
 @api_router.get("/fuel-rates")
-async def get_fuel_rates(request: Request, date: Optional[str] = None):
-    """Get fuel rates for a specific date"""
+async def get_fuel_rates(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Get fuel rates for a specific date or from/to range, paged when limit or cursor is given"""
     user = await require_auth(request)
     
-    query = {"user_id": user.id}
+    query = date_range_query(user.id, date, date_from, date_to)
+    
+    if limit or cursor:
+        return negotiated_response(request, await find_page(db.fuel_rates, query, limit, cursor))
+    
+    headers = None
     if date:
-        query["date"] = date
+        headers, not_modified = await check_list_etag(request, user.id, "fuel_rates", query["date"])
+        if not_modified:
+            return not_modified
     
-    rates = await db.fuel_rates.find(query).to_list(1000)
-    # Remove MongoDB _id field to avoid serialization issues
-    for rate in rates:
-        if "_id" in rate:
-            del rate["_id"]
-    return rates
+    # Project out MongoDB _id, which is not JSON serializable
+    rates = await db.fuel_rates.find(query, {"_id": 0}).to_list(1000)
+    return negotiated_response(request, rates, headers)
 
 @api_router.post("/fuel-rates")
 async def create_fuel_rate(request: Request, rate_data: dict):
     """Create/update fuel rate record"""
     user = await require_auth(request)
     
-    rate = FuelRate(
-        user_id=user.id,
-        **rate_data
-    )
+    with timed("model"):
+        rate = FuelRate(
+            user_id=user.id,
+            **rate_data
+        )
     
-    await db.fuel_rates.insert_one(rate.dict())
+    await insert_record("fuel_rates", rate.dict(), client_id="id" in rate_data)
     return {"message": "Fuel rate created", "id": rate.id}
 
+@api_router.post("/fuel-rates/bulk")
+async def create_fuel_rates_bulk(request: Request, items: List[dict]):
+    """Create many fuel rate records in one request"""
+    user = await require_auth(request)
+    
+    return await bulk_insert(db.fuel_rates, FuelRate, user, items)
+
+@api_router.get("/nozzles/readings")
+async def get_nozzle_readings(request: Request):
+    """Current meter state of every nozzle, for autofilling the next opening reading"""
+    user = await require_auth(request)
+    
+    readings = await nozzle_readings.get(user.id)
+    return {"nozzles": [readings[nozzle_id] for nozzle_id in sorted(readings)]}
+
+@api_router.get("/fuel-rates/effective")
+async def get_effective_fuel_rates(request: Request, date: Optional[str] = None, fuel_type: Optional[str] = None):
+    """Rate in force on a date (default today) per fuel type, from the in-process rate index"""
+    user = await require_auth(request)
+    
+    date = _query_date(date) if date else datetime.now(timezone.utc).date().isoformat()
+    effective = await rate_index.effective(user.id, date)
+    if fuel_type:
+        if fuel_type not in effective:
+            raise HTTPException(status_code=404, detail=f"No {fuel_type} rate in force on {date}")
+        effective = {fuel_type: effective[fuel_type]}
+    
+    return TimedORJSONResponse({
+        "date": date,
+        "rates": [
+            {"fuel_type": name, "rate": rate["rate"], "effective_from": rate["date"], "id": rate["id"]}
+            for name, rate in sorted(effective.items())
+        ],
+    })
+
+# Reporting helpers
+REPORT_PERIODS = {
+    "day": "$date",
+    "month": {"$substrCP": ["$date", 0, 7]},  # ISO dates, so YYYY-MM
+}
+
+async def _aggregate(collection, match: dict, group_keys: dict, fields: List[str]) -> List[dict]:
+    """Group matched records and sum the given fields, plus a record count"""
+    group = {"_id": group_keys, "count": {"$sum": 1}}
+    for field in fields:
+        group[field] = {"$sum": f"${field}"}
+    pipeline = [{"$match": match}, {"$group": group}, {"$sort": {"_id": 1}}]
+    rows = await collection.aggregate(pipeline).to_list(None)
+    return [{**row.pop("_id"), **row} for row in rows]
+
+async def build_summary_report(match: dict, period: str) -> dict:
+    """Totals per period by fuel type and income/expense category"""
+    period_key = REPORT_PERIODS[period]
+    fuel_rows, credit_rows, cash_rows = await asyncio.gather(
+        _aggregate(db.fuel_sales, match, {"period": period_key, "fuel_type": "$fuel_type"}, ["liters", "amount"]),
+        _aggregate(db.credit_sales, match, {"period": period_key}, ["amount"]),
+        _aggregate(db.income_expenses, match, {"period": period_key, "type": "$type", "category": "$category"}, ["amount"]),
+    )
+    
+    periods = {}
+    def period_entry(key):
+        if key not in periods:
+            periods[key] = {
+                "period": key,
+                "fuel": [],
+                "credit": {"amount": 0, "count": 0},
+                "income": [],
+                "expense": [],
+            }
+        return periods[key]
+    
+    for row in fuel_rows:
+        period_entry(row.pop("period"))["fuel"].append(row)
+    for row in credit_rows:
+        period_entry(row.pop("period"))["credit"] = row
+    for row in cash_rows:
+        entry = period_entry(row.pop("period"))
+        record_type = row.pop("type")
+        if record_type in ("income", "expense"):
+            entry[record_type].append(row)
+    
+    totals = {"fuel_liters": 0, "fuel_amount": 0, "credit_amount": 0, "income_amount": 0, "expense_amount": 0}
+    for entry in periods.values():
+        entry["totals"] = {
+            "fuel_liters": sum(row["liters"] for row in entry["fuel"]),
+            "fuel_amount": sum(row["amount"] for row in entry["fuel"]),
+            "credit_amount": entry["credit"]["amount"],
+            "income_amount": sum(row["amount"] for row in entry["income"]),
+            "expense_amount": sum(row["amount"] for row in entry["expense"]),
+        }
+        for key, value in entry["totals"].items():
+            totals[key] += value
+    
+    return {"periods": [periods[key] for key in sorted(periods)], "totals": totals}
+
+@api_router.get("/reports/summary")
+async def get_summary_report(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    period: str = "day",
+):
+    """Daily or monthly totals for a date or date range, aggregated in MongoDB"""
+    user = await require_auth(request)
+    
+    if period not in REPORT_PERIODS:
+        raise HTTPException(status_code=400, detail="period must be day or month")
+    
+    report = await build_summary_report(date_range_query(user.id, date, date_from, date_to), period)
+    return {"period": period, "date": date, "from": date_from, "to": date_to, **report}
+
+@api_router.get("/reports/daily-summaries")
+async def get_daily_summaries(
+    request: Request,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    """Read the maintained per-day rollups, one document per day"""
+    user = await require_auth(request)
+    
+    query = date_range_query(user.id, None, date_from, date_to)
+    summaries = await db.daily_summaries.find(query, {"_id": 0}).sort("date", ASCENDING).to_list(None)
+    return TimedORJSONResponse(summaries)
+
+@api_router.post("/reports/daily-summaries/rebuild")
+async def rebuild_user_daily_summaries(request: Request):
+    """Recompute the current user's daily rollups from raw records"""
+    user = await require_auth(request)
+    
+    days = await rebuild_daily_summaries(user.id)
+    return {"message": "Daily summaries rebuilt", "days": days}
+
+# Export helpers
+EXPORT_BATCH = 1000  # documents per cursor batch, and rows per XLSX append
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# (header, field) per exported collection, matching the columns of the
+# browser-side CSV export
+EXPORT_COLUMNS = {
+    "fuel_sales": [
+        ("Date", "date"), ("Nozzle", "nozzle_id"), ("Fuel Type", "fuel_type"),
+        ("Start Reading", "opening_reading"), ("End Reading", "closing_reading"),
+        ("Liters", "liters"), ("Rate", "rate"), ("Amount", "amount"),
+    ],
+    "credit_sales": [
+        ("Date", "date"), ("Customer", "customer_name"), ("Amount", "amount"), ("Description", "description"),
+    ],
+    "income_expenses": [
+        ("Date", "date"), ("Type", "type"), ("Category", "category"), ("Amount", "amount"),
+        ("Description", "description"),
+    ],
+}
+EXPORT_SHEET_TITLES = {"fuel_sales": "Fuel Sales", "credit_sales": "Credit Sales", "income_expenses": "Income & Expenses"}
+
+def _export_cell(value):
+    # Keep spreadsheet apps from evaluating user text as a formula
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@"):
+        return "'" + value
+    return "" if value is None else value
+
+async def _export_batches(collection_name: str, query: dict):
+    """Rows of one collection in list order, a cursor batch at a time"""
+    fields = [field for _, field in EXPORT_COLUMNS[collection_name]]
+    projection = {"_id": 0, **{field: 1 for field in fields}}
+    cursor = db[collection_name].find(query, projection, batch_size=EXPORT_BATCH).sort(PAGE_SORT)
+    rows = []
+    async for document in cursor:
+        rows.append([_export_cell(document.get(field)) for field in fields])
+        if len(rows) >= EXPORT_BATCH:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+async def _stream_csv(collection_name: str, query: dict):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS[collection_name]])
+    async for rows in _export_batches(collection_name, query):
+        writer.writerows(rows)
+        if buffer.tell() >= EXPORT_CHUNK_BYTES:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+async def _build_xlsx(collection_names: List[str], query: dict):
+    """Write-only workbook, one sheet per collection, spooled to a temp file
+
+    openpyxl keeps only the current row in memory in write-only mode, but a
+    zip can only be finished once every sheet is written, so unlike CSV the
+    download starts after the workbook is complete.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    for collection_name in collection_names:
+        sheet = workbook.create_sheet(EXPORT_SHEET_TITLES[collection_name])
+        sheet.append([header for header, _ in EXPORT_COLUMNS[collection_name]])
+        async for rows in _export_batches(collection_name, query):
+            await asyncio.to_thread(lambda: [sheet.append(row) for row in rows])
+    
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    await asyncio.to_thread(workbook.save, spool)
+    spool.seek(0)
+    return spool
+
+async def _stream_file(spool):
+    try:
+        while chunk := await asyncio.to_thread(spool.read, EXPORT_CHUNK_BYTES):
+            yield chunk
+    finally:
+        spool.close()
+
+@api_router.get("/export")
+async def export_records(
+    request: Request,
+    collection: List[str] = Query(list(EXPORT_COLUMNS)),
+    format: str = "csv",
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+):
+    """Stream records for a date or from/to range as CSV, or as an XLSX workbook"""
+    user = await require_auth(request)
+    
+    unknown = [name for name in collection if name not in EXPORT_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown collection: {', '.join(unknown)}")
+    if format not in ("csv", "xlsx"):
+        raise HTTPException(status_code=400, detail="format must be csv or xlsx")
+    if format == "csv" and len(collection) != 1:
+        raise HTTPException(status_code=400, detail="CSV export takes exactly one collection")
+    
+    query = date_range_query(user.id, date, date_from, date_to)
+    period = date or f"{date_from or 'start'}-to-{date_to or 'end'}"
+    if format == "csv":
+        filename = f"{collection[0]}-{period}.csv"
+        stream = _stream_csv(collection[0], query)
+        media_type = "text/csv"
+    else:
+        filename = f"export-{period}.xlsx"
+        stream = _stream_file(await _build_xlsx(collection, query))
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(stream, media_type=media_type, headers=headers)
+
+# Meter reading reconciliation
+RECONCILE_TOLERANCE = float(os.environ.get('RECONCILE_TOLERANCE', '0.01'))
+RECONCILE_MAX_ISSUES = 500  # flagged records listed in a report
+RECONCILE_CHECKS = ["reading_gap", "liters_mismatch", "amount_mismatch", "rate_mismatch", "rate_missing"]
+RECONCILE_SALE_FIELDS = [
+    "id", "date", "created_at", "nozzle_id", "fuel_type",
+    "opening_reading", "closing_reading", "liters", "rate", "amount",
+]
+
+def reconcile_sales(sales: pd.DataFrame, rates: pd.DataFrame, tolerance: float = RECONCILE_TOLERANCE) -> dict:
+    """Check fuel sales for consistency in whole-column passes
+
+    Per nozzle, in reading order: each closing reading must equal the next
+    opening reading, liters must equal closing - opening, amount must equal
+    liters * rate, and rate must equal the fuel_rates entry in force on the
+    sale date.
+    """
+    report = {"checked": len(sales), "nozzles": 0, "issues": {check: 0 for check in RECONCILE_CHECKS}, "records": []}
+    if sales.empty:
+        return report
+    
+    sales = sales.sort_values(["nozzle_id", "date", "created_at"], kind="stable").reset_index(drop=True)
+    sales["day"] = pd.to_datetime(sales["date"])
+    opening = sales["opening_reading"].to_numpy(dtype=float)
+    closing = sales["closing_reading"].to_numpy(dtype=float)
+    liters = sales["liters"].to_numpy(dtype=float)
+    rate = sales["rate"].to_numpy(dtype=float)
+    amount = sales["amount"].to_numpy(dtype=float)
+    
+    next_opening = sales.groupby("nozzle_id", sort=False)["opening_reading"].shift(-1).to_numpy(dtype=float)
+    expected_liters = closing - opening
+    expected_amount = liters * rate
+    
+    # Rate in force: the latest rate dated on or before the sale, per fuel type
+    expected_rate = np.full(len(sales), np.nan)
+    if not rates.empty:
+        rates = rates.sort_values(["date", "created_at"], kind="stable")
+        rates = rates.drop_duplicates(["fuel_type", "date"], keep="last")
+        rates = rates.assign(day=pd.to_datetime(rates["date"]))[["day", "fuel_type", "rate"]]
+        by_day = sales[["day", "fuel_type"]].reset_index().sort_values("day", kind="stable")
+        matched = pd.merge_asof(by_day, rates.rename(columns={"rate": "expected_rate"}), on="day", by="fuel_type")
+        expected_rate[matched["index"].to_numpy()] = matched["expected_rate"].to_numpy(dtype=float)
+    
+    flags = {
+        "reading_gap": ~np.isnan(next_opening) & (np.abs(next_opening - closing) > tolerance),
+        "liters_mismatch": np.abs(liters - expected_liters) > tolerance,
+        "amount_mismatch": np.abs(amount - expected_amount) > tolerance,
+        "rate_mismatch": ~np.isnan(expected_rate) & (np.abs(rate - expected_rate) > tolerance),
+        "rate_missing": np.isnan(expected_rate),
+    }
+    report["nozzles"] = int(sales["nozzle_id"].nunique())
+    report["issues"] = {check: int(flag.sum()) for check, flag in flags.items()}
+    
+    flagged = np.flatnonzero(np.logical_or.reduce(list(flags.values())))[:RECONCILE_MAX_ISSUES]
+    expected = {
+        "next_opening_reading": next_opening,
+        "liters": expected_liters,
+        "amount": expected_amount,
+        "rate": expected_rate,
+    }
+    for position in flagged:
+        report["records"].append({
+            "id": sales.at[position, "id"],
+            "date": sales.at[position, "date"],
+            "nozzle_id": sales.at[position, "nozzle_id"],
+            "fuel_type": sales.at[position, "fuel_type"],
+            "issues": [check for check, flag in flags.items() if flag[position]],
+            "expected": {
+                name: None if np.isnan(values[position]) else round(float(values[position]), 2)
+                for name, values in expected.items()
+            },
+        })
+    return report
+
+async def reconcile_user(user_id: str, query: dict) -> dict:
+    """Load a user's sales and rates into frames and reconcile them"""
+    sale_projection = {"_id": 0, **{field: 1 for field in RECONCILE_SALE_FIELDS}}
+    sales = await db.fuel_sales.find(query, sale_projection).sort(PAGE_SORT).to_list(None)
+    # Rates dated before the range can still be in force inside it
+    rate_query = {"user_id": user_id}
+    if isinstance(query.get("date"), str):
+        rate_query["date"] = {"$lte": query["date"]}
+    elif "$lte" in query.get("date", {}):
+        rate_query["date"] = {"$lte": query["date"]["$lte"]}
+    rates = await db.fuel_rates.find(
+        rate_query, {"_id": 0, "date": 1, "created_at": 1, "fuel_type": 1, "rate": 1}
+    ).to_list(None)
+    
+    sales_frame = pd.DataFrame(sales, columns=RECONCILE_SALE_FIELDS)
+    rates_frame = pd.DataFrame(rates, columns=["date", "created_at", "fuel_type", "rate"])
+    return await asyncio.to_thread(reconcile_sales, sales_frame, rates_frame)
+
+@api_router.get("/reconciliation")
+async def get_reconciliation(
+    request: Request,
+    date: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    nozzle_id: Optional[str] = None,
+):
+    """Meter reading, liters, amount and rate consistency of fuel sales"""
+    user = await require_auth(request)
+    
+    query = date_range_query(user.id, date, date_from, date_to)
+    if nozzle_id:
+        query["nozzle_id"] = nozzle_id
+    return await reconcile_user(user.id, query)
+
+# Backup streaming helpers
+DATA_COLLECTIONS = ["fuel_sales", "credit_sales", "income_expenses", "fuel_rates"]
+BACKUP_PREFETCH = 500  # documents buffered per collection while streaming
+BACKUP_CHUNK_BYTES = 64 * 1024
+BACKUP_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "msgpack": MSGPACK_MEDIA_TYPES[0],
+}
+_END_OF_CURSOR = object()
+
+def _dumps(value) -> bytes:
+    return orjson.dumps(value)
+
+async def _prefetch_cursor(cursor, queue: asyncio.Queue):
+    """Pump a cursor into a bounded queue so collections are fetched concurrently"""
+    try:
+        async for document in cursor:
+            await queue.put(document)
+        await queue.put(_END_OF_CURSOR)
+    except Exception as e:
+        await queue.put(e)
+
+async def _drain_queue(queue: asyncio.Queue):
+    while True:
+        item = await queue.get()
+        if item is _END_OF_CURSOR:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+async def _backup_fragments(user: User, backup_format: str):
+    """Yield the backup as encoded JSON fragments, reading all collections concurrently"""
+    queues = {name: asyncio.Queue(maxsize=BACKUP_PREFETCH) for name in DATA_COLLECTIONS}
+    tasks = [
+        asyncio.create_task(_prefetch_cursor(
+            db[name].find({"user_id": user.id}, {"_id": 0}, batch_size=BACKUP_PREFETCH),
+            queues[name],
+        ))
+        for name in DATA_COLLECTIONS
+    ]
+    try:
+        if backup_format in ("ndjson", "msgpack"):
+            # One framed entry per record: JSON lines, or self-delimiting msgpack objects
+            encode = _packb if backup_format == "msgpack" else (lambda entry: _dumps(entry) + b"\n")
+            yield encode({"type": "user", "data": user.dict()})
+            for name in DATA_COLLECTIONS:
+                async for document in _drain_queue(queues[name]):
+                    yield encode({"type": name, "data": document})
+            yield encode({"type": "backup_date", "data": datetime.now(timezone.utc).isoformat()})
+        else:
+            yield b'{"user": ' + _dumps(user.dict())
+            for name in DATA_COLLECTIONS:
+                yield f', "{name}": ['.encode()
+                separator = b""
+                async for document in _drain_queue(queues[name]):
+                    yield separator + _dumps(document)
+                    separator = b", "
+                yield b"]"
+            yield b', "backup_date": ' + _dumps(datetime.now(timezone.utc).isoformat()) + b"}"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _stream_backup(user: User, backup_format: str, compress: bool):
+    """Group backup fragments into chunks, optionally gzipping on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    buffered = 0
+    async for fragment in _backup_fragments(user, backup_format):
+        buffer.append(fragment)
+        buffered += len(fragment)
+        if buffered >= BACKUP_CHUNK_BYTES:
+            chunk = b"".join(buffer)
+            buffer, buffered = [], 0
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
+
 # Sync endpoint for Gmail backup
 @api_router.post("/sync/backup")
-async def backup_data(request: Request):
-    """Backup all user data for Gmail sync"""
+async def backup_data(request: Request, format: Optional[str] = None, gzip: bool = False):
+    """Stream a backup of all user data for Gmail sync"""
+    user = await require_auth(request)
+    
+    if format is None:
+        format = "msgpack" if wants_msgpack(request) else "json"
+    if format not in BACKUP_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or msgpack")
+    
+    # An explicit gzip=true is already compressed, so the gzip middleware leaves it alone
+    headers = {"Content-Encoding": "gzip"} if gzip else {}
+    media_type = BACKUP_MEDIA_TYPES[format]
+    return StreamingResponse(_stream_backup(user, format, gzip), media_type=media_type, headers=headers)
+
+# Restore helpers
+RESTORE_CHUNK = 1000  # upserts per bulk_write
+MAX_RESTORE_RECORD_BYTES = 1024 * 1024  # largest single value we buffer while parsing
+
+class BackupParser:
+    """Incremental parser for the backup document written by /sync/backup
+
+    Feed it the body in arbitrary chunks; each call returns the
+    (collection name, record) pairs completed so far. Only one record is
+    held in memory at a time, never the whole document.
+    """
+
+    _WHITESPACE = " \t\r\n"
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._text = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+
+    def feed(self, data: bytes, final: bool = False) -> List[tuple]:
+        self._text = self._text[self._pos:] + self._utf8.decode(data, final)
+        self._pos = 0
+        records = []
+        while self._step(records, final):
+            pass
+        if final and self._state != "done":
+            raise ValueError("Backup document is truncated")
+        if len(self._text) - self._pos > MAX_RESTORE_RECORD_BYTES:
+            raise ValueError("Backup record too large")
+        return records
+
+    def _skip(self, characters: str) -> Optional[str]:
+        """Skip whitespace and the given separators; the next character, or None if more data is needed"""
+        while self._pos < len(self._text) and self._text[self._pos] in self._WHITESPACE + characters:
+            self._pos += 1
+        return self._text[self._pos] if self._pos < len(self._text) else None
+
+    def _decode_value(self, final: bool):
+        try:
+            value, end = self._decoder.raw_decode(self._text, self._pos)
+        except json.JSONDecodeError:
+            if final:
+                raise ValueError("Backup document is not valid JSON")
+            return None, False
+        self._pos = end
+        return value, True
+
+    def _step(self, records: list, final: bool) -> bool:
+        """Advance one token; False when more input is needed"""
+        if self._state == "done":
+            return False
+        if self._state == "start":
+            char = self._skip("")
+            if char is None:
+                return False
+            if char != "{":
+                raise ValueError("Backup must be a JSON object")
+            self._pos += 1
+            self._state = "key"
+            return True
+        if self._state == "key":
+            char = self._skip(",")
+            if char is None:
+                return False
+            if char == "}":
+                self._pos += 1
+                self._state = "done"
+                return True
+            key, complete = self._decode_value(final)
+            if not complete:
+                return False
+            if not isinstance(key, str):
+                raise ValueError("Backup keys must be strings")
+            self._key = key
+            self._state = "colon"
+            return True
+        if self._state == "colon":
+            char = self._skip("")
+            if char is None:
+                return False
+            if char != ":":
+                raise ValueError("Expected ':' in backup document")
+            self._pos += 1
+            self._state = "value"
+            return True
+        if self._state == "value":
+            char = self._skip("")
+            if char is None:
+                return False
+            if self._key in DATA_COLLECTIONS and char == "[":
+                self._pos += 1
+                self._state = "array"
+                return True
+            _, complete = self._decode_value(final)  # user, backup_date and unknown keys
+            if complete:
+                self._state = "key"
+            return complete
+        # inside a collection's array
+        char = self._skip(",")
+        if char is None:
+            return False
+        if char == "]":
+            self._pos += 1
+            self._state = "key"
+            return True
+        record, complete = self._decode_value(final)
+        if complete:
+            records.append((self._key, record))
+        return complete
+
+def _backup_entry(entry) -> Optional[tuple]:
+    """(collection name, record) of a framed backup entry, None for user and backup_date"""
+    if isinstance(entry, dict) and entry.get("type") in DATA_COLLECTIONS:
+        return entry["type"], entry.get("data")
+    return None
+
+class NdjsonBackupParser:
+    """Incremental parser for the ndjson backup format, one entry per line"""
+
+    def __init__(self):
+        self._pending = b""
+
+    def feed(self, data: bytes, final: bool = False) -> List[tuple]:
+        lines = (self._pending + data).split(b"\n")
+        self._pending = b"" if final else lines.pop()
+        if len(self._pending) > MAX_RESTORE_RECORD_BYTES:
+            raise ValueError("Backup record too large")
+        records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                record = _backup_entry(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                raise ValueError("Backup line is not valid JSON")
+            if record:
+                records.append(record)
+        return records
+
+class MsgPackBackupParser:
+    """Incremental parser for the msgpack backup format, a stream of framed entries"""
+
+    def __init__(self):
+        self._unpacker = msgpack.Unpacker(max_buffer_size=MAX_RESTORE_RECORD_BYTES)
+        self._fed = 0
+
+    def feed(self, data: bytes, final: bool = False) -> List[tuple]:
+        try:
+            self._unpacker.feed(data)
+        except msgpack.BufferFull:
+            raise ValueError("Backup record too large")
+        self._fed += len(data)
+        records = [record for record in map(_backup_entry, self._unpacker) if record]
+        if final and self._unpacker.tell() != self._fed:
+            raise ValueError("Backup document is truncated")
+        return records
+
+BACKUP_PARSERS = {"json": BackupParser, "ndjson": NdjsonBackupParser, "msgpack": MsgPackBackupParser}
+
+async def _backup_records(request: Request, backup_format: str):
+    """Yield lists of (collection name, record) as the upload arrives"""
+    decompressor = None
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        decompressor = zlib.decompressobj(31)
+    
+    parser = BACKUP_PARSERS[backup_format]()
+    async for chunk in request.stream():
+        if decompressor:
+            chunk = decompressor.decompress(chunk)
+        yield parser.feed(chunk)
+    yield parser.feed(decompressor.flush() if decompressor else b"", final=True)
+
+def _same_record(stored: dict, document: dict) -> bool:
+    """Whether a restored document matches the stored one, ignoring updated_at"""
+    # Round-trip through BSON so datetimes come back naive and at millisecond
+    # precision, as the client (default codec options) returns stored ones
+    document = bson.decode(bson.encode(document))
+    document.pop("updated_at", None)
+    return {key: value for key, value in stored.items() if key != "updated_at"} == document
+
+async def _write_restore_chunk(collection_name: str, user_id: str, documents: List[dict], counts: dict):
+    """Upsert the records that are new or changed; only those get a new updated_at"""
+    collection = db[collection_name]
+    stored = {}
+    async for document in collection.find(
+        {"user_id": user_id, "id": {"$in": [document["id"] for document in documents]}}, {"_id": 0}
+    ):
+        stored[document["id"]] = document
+    
+    now = datetime.now(timezone.utc)
+    operations = []
+    for document in documents:
+        if document["id"] in stored and _same_record(stored[document["id"]], document):
+            counts["unchanged"] += 1
+            continue
+        operations.append(
+            ReplaceOne({"user_id": user_id, "id": document["id"]}, {**document, "updated_at": now}, upsert=True)
+        )
+    if operations:
+        result = await collection.bulk_write(operations, ordered=False)
+        counts["inserted"] += result.upserted_count
+        counts["updated"] += result.matched_count
+
+async def restore_backup(request: Request, user: User, backup_format: str) -> dict:
+    """Upsert every record of a streamed backup into the user's collections"""
+    counts = {name: {"inserted": 0, "updated": 0, "unchanged": 0, "invalid": 0} for name in DATA_COLLECTIONS}
+    operations = {name: [] for name in DATA_COLLECTIONS}  # documents awaiting a chunk write
+    in_flight = None  # one chunk is written while the next is parsed
+    written = 0
+    touched = set()  # (user_id, collection, date) keys of restored records
+    
+    async def flush(collection_name: str):
+        nonlocal in_flight, written
+        if in_flight:
+            await in_flight
+        chunk, operations[collection_name] = operations[collection_name], []
+        written += len(chunk)
+        in_flight = asyncio.create_task(_write_restore_chunk(collection_name, user.id, chunk, counts[collection_name]))
+        logger.info(f"Restore for {user.id}: {written} records sent to the database")
+    
+    error = None
+    try:
+        async for records in _backup_records(request, backup_format):
+            for collection_name, record in records:
+                try:
+                    with timed("model"):
+                        document = RECORD_MODELS[collection_name](**{**record, "user_id": user.id}).dict()
+                except (ValidationError, TypeError):
+                    counts[collection_name]["invalid"] += 1
+                    continue
+                operations[collection_name].append(document)
+                touched.add((user.id, collection_name, document["date"]))
+                if len(operations[collection_name]) >= RESTORE_CHUNK:
+                    await flush(collection_name)
+        for collection_name in DATA_COLLECTIONS:
+            if operations[collection_name]:
+                await flush(collection_name)
+    except ValueError as e:
+        error = f"Invalid backup after {written} records: {str(e)}"
+    except zlib.error:
+        error = "Invalid gzip body"
+    finally:
+        if in_flight:
+            await in_flight
+    
+    if written:
+        # Rollups and the rate index are derived from the restored records
+        await rebuild_daily_summaries(user.id)
+        await rebuild_nozzle_readings(user.id)
+        await record_versions.bump(touched)
+        rate_index.invalidate_user(user.id)
+    if error:
+        raise HTTPException(status_code=400, detail=error)
+    return counts
+
+@api_router.post("/sync/restore")
+async def restore_data(request: Request, format: Optional[str] = None):
+    """Load a backup from /sync/backup back in; safe to repeat"""
+    user = await require_auth(request)
+    
+    if format is None:
+        content_type = request.headers.get("content-type", "").split(";")[0].strip()
+        format = "msgpack" if content_type in MSGPACK_MEDIA_TYPES else "json"
+    if format not in BACKUP_PARSERS:
+        raise HTTPException(status_code=400, detail="format must be json, ndjson or msgpack")
+    
+    started = time.perf_counter()
+    counts = await restore_backup(request, user, format)
+    return {
+        "message": "Backup restored",
+        "collections": counts,
+        "records": sum(sum(collection.values()) for collection in counts.values()),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+# Delta sync helpers
+SYNC_BATCH_SIZE = 500
+# Records are only handed out once they are this old, so a write that
+# commits slightly out of timestamp order is not skipped by a watermark
+SYNC_SETTLE_SECONDS = 2
+
+def encode_sync_cursor(watermarks: dict) -> str:
+    """Opaque token holding the last (updated_at, id) seen per collection"""
+    return base64.urlsafe_b64encode(json.dumps(watermarks).encode()).decode()
+
+def decode_sync_cursor(cursor: Optional[str]) -> dict:
+    if not cursor:
+        return {}
+    try:
+        watermarks = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            name: (datetime.fromisoformat(updated_at), record_id)
+            for name, (updated_at, record_id) in watermarks.items()
+            if name in DATA_COLLECTIONS
+        }
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+async def _changes_since(collection_name: str, user_id: str, watermark, until: datetime, limit: int) -> List[dict]:
+    query = {"user_id": user_id, "updated_at": {"$lte": until}}
+    if watermark:
+        updated_at, record_id = watermark
+        query["$or"] = [
+            {"updated_at": {"$gt": updated_at}},
+            {"updated_at": updated_at, "id": {"$gt": record_id}},
+        ]
+    cursor = db[collection_name].find(query, {"_id": 0}).sort(SYNC_SORT).limit(limit + 1)
+    return await cursor.to_list(limit + 1)
+
+@api_router.get("/sync/changes")
+async def get_sync_changes(
+    request: Request,
+    since: Optional[str] = None,
+    limit: int = Query(SYNC_BATCH_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Records created or modified after the since cursor, across all data collections"""
     user = await require_auth(request)
     
-    # Get all user data
-    fuel_sales = await db.fuel_sales.find({"user_id": user.id}).to_list(1000)
-    credit_sales = await db.credit_sales.find({"user_id": user.id}).to_list(1000)
-    income_expenses = await db.income_expenses.find({"user_id": user.id}).to_list(1000)
-    fuel_rates = await db.fuel_rates.find({"user_id": user.id}).to_list(1000)
-    
-    # Remove MongoDB _id fields to avoid serialization issues
-    for collection in [fuel_sales, credit_sales, income_expenses, fuel_rates]:
-        for item in collection:
-            if "_id" in item:
-                del item["_id"]
-    
-    backup_data = {
-        "user": user.dict(),
-        "fuel_sales": fuel_sales,
-        "credit_sales": credit_sales,
-        "income_expenses": income_expenses,
-        "fuel_rates": fuel_rates,
-        "backup_date": datetime.now(timezone.utc).isoformat()
+    watermarks = decode_sync_cursor(since)
+    until = datetime.now(timezone.utc) - timedelta(seconds=SYNC_SETTLE_SECONDS)
+    batches = await asyncio.gather(*[
+        _changes_since(name, user.id, watermarks.get(name), until, limit)
+        for name in DATA_COLLECTIONS
+    ])
+    
+    changes = {}
+    has_more = False
+    next_watermarks = {
+        name: [updated_at.isoformat(), record_id] for name, (updated_at, record_id) in watermarks.items()
     }
+    for name, records in zip(DATA_COLLECTIONS, batches):
+        if len(records) > limit:
+            records = records[:limit]
+            has_more = True
+        if records:
+            next_watermarks[name] = [records[-1]["updated_at"].isoformat(), records[-1]["id"]]
+        changes[name] = records
+    
+    return TimedORJSONResponse({**changes, "next": encode_sync_cursor(next_watermarks), "has_more": has_more})
+
+# Live event stream
+EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', '256'))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get('EVENT_HEARTBEAT_SECONDS', '15'))
+
+class EventBroker:
+    """Fan record events out to each user's open event streams"""
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers = {}  # user_id -> set of bounded queues
+        self.published = 0
+        self.resyncs = 0
+
+    @contextmanager
+    def subscribe(self, user_id: str):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers[user_id]
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, user_id: str, event_type: str, data: dict):
+        for queue in self._subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait((event_type, data))
+            except asyncio.QueueFull:
+                # A client this far behind refetches instead of replaying a backlog
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("resync", {}))
+                self.resyncs += 1
+        self.published += 1
+
+    def publish_records(self, collection_name: str, documents: List[dict]):
+        for document in documents:
+            if document["user_id"] in self._subscribers:
+                record = {field: value for field, value in document.items() if field != "_id"}
+                self.publish(document["user_id"], f"{collection_name}.created", record)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "streams": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "resyncs": self.resyncs,
+        }
+
+event_broker = EventBroker(queue_size=EVENT_QUEUE_SIZE)
+
+def _sse_message(event_id: int, event_type: str, data: dict) -> bytes:
+    return f"id: {event_id}\nevent: {event_type}\ndata: ".encode() + _dumps(data) + b"\n\n"
+
+async def session_expires_at(session_token: str) -> Optional[float]:
+    """Unix time at which a session token stops being valid"""
+    if is_signed_token(session_token):
+        payload = signed_sessions.decode(session_token)
+        return payload["exp"] if payload else None
+    session = await db.user_sessions.find_one({"session_token": session_token}, {"expires_at": 1})
+    if not session:
+        return None
+    # Motor returns naive UTC datetimes
+    return session["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+
+async def _event_stream(user: User, session_token: str, expires_at: float):
+    with event_broker.subscribe(user.id) as queue:
+        yield b"retry: 3000\n\n"
+        event_id = 0
+        next_check = time.monotonic() + EVENT_HEARTBEAT_SECONDS
+        while True:
+            timeout = min(next_check - time.monotonic(), expires_at - time.time())
+            try:
+                event_type, data = await asyncio.wait_for(queue.get(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                # The session is re-checked every heartbeat, busy or idle, so a
+                # logout or expiry ends the stream and the reconnect gets a 401
+                if time.time() >= expires_at or await user_for_session(session_token) is None:
+                    return
+                next_check = time.monotonic() + EVENT_HEARTBEAT_SECONDS
+                # Keeps proxies from closing an idle connection
+                yield b": heartbeat\n\n"
+                continue
+            event_id += 1
+            yield _sse_message(event_id, event_type, data)
+
+@api_router.get("/events/stream")
+async def stream_events(request: Request):
+    """Server-Sent Events for records created on any of the user's devices
+
+    Events are named <collection>.created and carry the record. A resync
+    event means events were dropped and the client should refetch.
+    """
+    user = await require_auth(request)
+    session_token = await get_session_token(request)
+    expires_at = await session_expires_at(session_token)
+    if expires_at is None:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(
+        _event_stream(user, session_token, expires_at), media_type="text/event-stream", headers=headers,
+    )
+
+# Cross-worker cache invalidation
+# With MULTI_WORKER=true each worker follows one change stream over the
+# collections behind its in-process state (session cache, signed-session
+# generations and revocations, rate index, nozzle cache, record versions), so a login,
+# logout or write handled by another worker reaches it within milliseconds.
+# The same stream carries new records to this worker's live event streams.
+# Change streams need a replica set; a single-node one is enough.
+MULTI_WORKER = os.environ.get('MULTI_WORKER', 'false').lower() in ('1', 'true', 'yes')
+CHANGE_STREAM_COLLECTIONS = [
+    "user_sessions", "users", "revoked_sessions", "fuel_rates", "nozzle_readings", "record_versions",
+]
+CHANGE_STREAM_MAX_BACKOFF = 30
+# The stream was closed for good, or its resume point left the oplog
+CHANGE_STREAM_RESETS = {"invalidate", "drop", "dropDatabase", "rename"}
+UNRESUMABLE_ERROR_CODES = {260, 280, 286}
+CHANGE_STREAM_PIPELINE = [{"$match": {"$or": [
+    {"ns.coll": {"$in": CHANGE_STREAM_COLLECTIONS}},
+    {"ns.coll": {"$in": DATA_COLLECTIONS}, "operationType": "insert"},
+]}}]
+
+change_stream_task: Optional[asyncio.Task] = None
+
+async def cluster_time():
+    """Current operationTime, a point a change stream can start from"""
+    reply = await db.command("ping")
+    if "operationTime" not in reply:
+        raise RuntimeError("MULTI_WORKER needs MongoDB running as a replica set")
+    return reply["operationTime"]
+
+async def reset_local_state():
+    """Forget everything cached, for when changes may have been missed"""
+    session_cache.clear()
+    rate_index.clear()
+    nozzle_readings.clear()
+    record_versions.clear()
+    await record_versions.load_epoch()
+    if SESSION_MODE == "signed":
+        await signed_sessions.load()
+
+def apply_change(change: dict):
+    """Drop or refresh the local state a change from any worker made stale"""
+    collection_name = change["ns"]["coll"]
+    operation = change["operationType"]
+    key = change.get("documentKey", {}).get("_id")
+    document = change.get("fullDocument")
     
-    return backup_data
+    if collection_name == "user_sessions":
+        if operation != "insert":
+            session_cache.invalidate_session(key)
+    elif collection_name == "users":
+        session_cache.invalidate_user(key)
+        if document and document.get("session_generation"):
+            signed_sessions.advance_generation(key, document["session_generation"])
+    elif collection_name == "revoked_sessions":
+        if document:
+            expires_at = document["expires_at"].replace(tzinfo=timezone.utc)
+            signed_sessions.revoke(key, expires_at.timestamp())
+    elif collection_name == "fuel_rates":
+        if document:
+            rate_index.invalidate_user(document["user_id"])
+        else:
+            rate_index.clear()
+    elif collection_name == "nozzle_readings":
+        if document:
+            nozzle_readings.apply(document)
+        else:
+            nozzle_readings.clear()
+    elif collection_name == "record_versions":
+        if key == RecordVersions.EPOCH_ID and document:
+            record_versions.epoch = document["epoch"]
+            record_versions.clear()
+        elif document:
+            record_versions.invalidate((document["user_id"], document["collection"], document["date"]))
+        else:
+            record_versions.clear()
+    
+    if operation == "insert" and collection_name in DATA_COLLECTIONS:
+        event_broker.publish_records(collection_name, [document])
+
+async def follow_change_stream(start_at):
+    """Apply changes from start_at on, resuming after errors with backoff"""
+    resume_token = None
+    failures = 0
+    while True:
+        try:
+            if resume_token is None and start_at is None:
+                # Nothing to resume from: anything cached may be stale
+                start_at = await cluster_time()
+                await reset_local_state()
+            options = {"resume_after": resume_token} if resume_token else {"start_at_operation_time": start_at}
+            async with db.watch(CHANGE_STREAM_PIPELINE, full_document="updateLookup", **options) as stream:
+                async for change in stream:
+                    failures = 0
+                    if change["operationType"] in CHANGE_STREAM_RESETS:
+                        logger.warning(f"Change stream {change['operationType']} event, resetting local caches")
+                        resume_token = start_at = None
+                        break
+                    apply_change(change)
+                    resume_token = stream.resume_token
+        except OperationFailure as e:
+            logger.error(f"Change stream failed: {str(e)}")
+            if e.code in UNRESUMABLE_ERROR_CODES:
+                resume_token = start_at = None
+        except PyMongoError as e:
+            logger.error(f"Change stream interrupted: {str(e)}")
+        else:
+            continue
+        failures += 1
+        await asyncio.sleep(min(CHANGE_STREAM_MAX_BACKOFF, 0.5 * 2 ** failures))
 
 # Include the router in the main app
 app.include_router(api_router)
 
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    """Count and time requests, adding a Server-Timing phase breakdown"""
+    started = time.perf_counter()
+    timings = RequestTimings()
+    request_timings.set(timings)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["Server-Timing"] = timings.server_timing(time.perf_counter() - started)
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        # Label by route template so path parameters don't explode cardinality
+        route = request.scope.get("route")
+        route_path = route.path if route else "unmatched"
+        http_requests.inc((request.method, route_path, str(status)))
+        http_request_seconds.observe((request.method, route_path), elapsed)
+        if elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning(
+                f"Slow request {request.method} {route_path} -> {status} "
+                f"in {elapsed * 1000:.1f}ms: {timings.summary() or 'no phases recorded'}"
+            )
+
+GZIP_MIN_BYTES = int(os.environ.get('GZIP_MIN_BYTES', '1024'))
+# Streams whose chunks must reach the client as soon as they are written
+GZIP_EXCLUDED_PATHS = {"/api/events/stream"}
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip large responses for clients that accept it, leaving live streams unbuffered"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in GZIP_EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Responses that set their own Content-Encoding pass through untouched
+app.add_middleware(SelectiveGZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=6)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -428,6 +3249,91 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_db_indexes():
+    await ensure_indexes()
+
+@app.on_event("startup")
+async def load_record_versions():
+    await record_versions.load_epoch()
+
+@app.on_event("startup")
+async def load_signed_sessions():
+    if SESSION_MODE == "signed":
+        await signed_sessions.load()
+
+@app.on_event("startup")
+async def start_change_stream():
+    global change_stream_task
+    if MULTI_WORKER:
+        # Start from before any request can fill a cache
+        change_stream_task = asyncio.create_task(follow_change_stream(await cluster_time()))
+
+@app.on_event("startup")
+async def open_auth_http_client():
+    global auth_http_client
+    auth_http_client = create_auth_http_client()
+
+@app.on_event("startup")
+async def start_write_behind():
+    global write_behind
+    if WRITE_BEHIND:
+        write_behind = WriteBehindBuffer(
+            WRITE_BEHIND_DIR,
+            batch_size=WRITE_BEHIND_BATCH,
+            flush_interval=WRITE_BEHIND_FLUSH_MS / 1000,
+            max_pending=WRITE_BEHIND_MAX_PENDING,
+            enqueue_timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT,
+        )
+        await write_behind.start()
+
+@app.on_event("shutdown")
+async def stop_change_stream():
+    if change_stream_task:
+        change_stream_task.cancel()
+
+@app.on_event("shutdown")
+async def stop_write_behind():
+    if write_behind:
+        await write_behind.stop()
+
+@app.on_event("shutdown")
+async def close_auth_http_client():
+    await auth_http_client.aclose()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Petrol pump backend maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild-summaries", help="Backfill the daily_summaries rollup")
+    rebuild_parser.add_argument("--user", help="Only rebuild this user id")
+    nozzle_parser = commands.add_parser("rebuild-nozzle-readings", help="Backfill the per-nozzle last reading")
+    nozzle_parser.add_argument("--user", help="Only rebuild this user id")
+    commands.add_parser("migrate-dates", help="Normalize stored record dates to YYYY-MM-DD")
+    commands.add_parser("backfill-updated-at", help="Set updated_at on records that predate delta sync")
+    reconcile_parser = commands.add_parser("reconcile", help="Check a user's fuel sales for reading and amount mismatches")
+    reconcile_parser.add_argument("--user", required=True, help="User id to reconcile")
+    reconcile_parser.add_argument("--from", dest="date_from", help="First date (YYYY-MM-DD)")
+    reconcile_parser.add_argument("--to", dest="date_to", help="Last date (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if args.command == "rebuild-summaries":
+        days = asyncio.run(rebuild_daily_summaries(args.user))
+        print(f"Rebuilt {days} daily summaries")
+    elif args.command == "rebuild-nozzle-readings":
+        nozzles = asyncio.run(rebuild_nozzle_readings(args.user))
+        print(f"Rebuilt {nozzles} nozzle readings")
+    elif args.command == "migrate-dates":
+        for collection_name, counts in asyncio.run(migrate_record_dates()).items():
+            print(f"{collection_name}: {counts['updated']} updated, {counts['unparseable']} unparseable")
+    elif args.command == "backfill-updated-at":
+        for collection_name, updated in asyncio.run(backfill_updated_at()).items():
+            print(f"{collection_name}: {updated} updated")
+    elif args.command == "reconcile":
+        query = date_range_query(args.user, None, args.date_from, args.date_to)
+        print(json.dumps(asyncio.run(reconcile_user(args.user, query)), indent=2))
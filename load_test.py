@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Load Test for Petrol Pump Management System
+Drives the authenticated read and write routes with many concurrent async
+clients, reports throughput and p50/p95/p99 per route, and fails when a
+route regresses past the stored baseline
+
+By default it starts the backend with uvicorn against a local mongod,
+using a throwaway database that is dropped afterwards:
+    python load_test.py --concurrency 200 --requests 2000
+    python load_test.py --update-baseline      # record a new baseline
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+from pymongo import MongoClient
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+DEFAULT_BASELINE = ROOT_DIR / "load_test_baseline.json"
+LOAD_TEST_DATE = "2024-01-15"
+SEED_DAYS = 30
+
+
+def fuel_sale(index):
+    opening = 1000.0 + index * 50
+    return {
+        "date": LOAD_TEST_DATE,
+        "fuel_type": "Petrol" if index % 2 else "Diesel",
+        "nozzle_id": f"N{index % 8}",
+        "opening_reading": opening,
+        "closing_reading": opening + 50,
+        "liters": 50.0,
+        "rate": 102.5,
+        "amount": 5125.0,
+    }
+
+
+def credit_sale(index):
+    return {"date": LOAD_TEST_DATE, "customer_name": f"Customer {index % 20}", "amount": 500.0}
+
+
+# name -> (method, path, body factory or None)
+SCENARIOS = {
+    "GET /api/auth/me": ("GET", "/api/auth/me", None),
+    "GET /api/fuel-sales?date": ("GET", f"/api/fuel-sales?date={LOAD_TEST_DATE}", None),
+    "GET /api/fuel-sales?limit": ("GET", "/api/fuel-sales?limit=100", None),
+    "GET /api/credit-sales?date": ("GET", f"/api/credit-sales?date={LOAD_TEST_DATE}", None),
+    "GET /api/reports/summary": ("GET", "/api/reports/summary?from=2024-01-01&to=2024-01-31", None),
+    "GET /api/fuel-rates/effective": ("GET", f"/api/fuel-rates/effective?date={LOAD_TEST_DATE}", None),
+    "POST /api/fuel-sales": ("POST", "/api/fuel-sales", fuel_sale),
+    "POST /api/credit-sales": ("POST", "/api/credit-sales", credit_sale),
+    "POST /api/fuel-sales/bulk": ("POST", "/api/fuel-sales/bulk", lambda index: [fuel_sale(index + i) for i in range(20)]),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def seed_database(mongo_url, db_name):
+    """Create a load-test user with a session token and some history"""
+    database = MongoClient(mongo_url)[db_name]
+    user_id = f"loadtest-{uuid.uuid4().hex[:8]}"
+    session_token = f"loadtest-{uuid.uuid4().hex}"
+    now = datetime.now(timezone.utc)
+
+    database.users.insert_one({"_id": user_id, "email": f"{user_id}@example.com", "name": "Load Test", "created_at": now})
+    database.user_sessions.insert_one({
+        "user_id": user_id,
+        "session_token": session_token,
+        "expires_at": now + timedelta(days=1),
+        "created_at": now,
+    })
+    database.fuel_rates.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": user_id, "date": f"2024-01-{day:02d}", "fuel_type": fuel_type,
+         "rate": 100.0 + day / 10, "created_at": now, "updated_at": now}
+        for day in range(1, SEED_DAYS + 1) for fuel_type in ("Petrol", "Diesel")
+    ])
+    database.fuel_sales.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": user_id, **fuel_sale(index),
+         "date": f"2024-01-{index % SEED_DAYS + 1:02d}", "created_at": now, "updated_at": now}
+        for index in range(SEED_DAYS * 20)
+    ])
+    return session_token
+
+
+def start_server(mongo_url, db_name, port):
+    env = {**os.environ, "MONGO_URL": mongo_url, "DB_NAME": db_name, "SLOW_REQUEST_MS": "60000"}
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_for_server(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/api/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Backend did not start at {base_url}")
+
+
+async def run_scenario(client, scenario, total_requests, concurrency):
+    method, path, make_body = SCENARIOS[scenario]
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < total_requests:
+            index = next_index
+            next_index += 1
+            body = make_body(index) if make_body else None
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Regression messages for routes slower or less productive than the baseline"""
+    regressions = []
+    for scenario, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{scenario}: {result['errors']} failed requests")
+        expected = baseline.get(scenario)
+        if not expected:
+            continue
+        if result["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {result['p95_ms']}ms vs baseline {expected['p95_ms']}ms")
+        if result["throughput_rps"] < expected["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: {result['throughput_rps']} req/s vs baseline {expected['throughput_rps']} req/s"
+            )
+    return regressions
+
+
+async def run_load_test(args, base_url, session_token):
+    await wait_for_server(base_url)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    headers = {"Authorization": f"Bearer {session_token}"}
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=60) as client:
+        for scenario in args.scenarios or SCENARIOS:
+            print(f"🔍 {scenario}: {args.requests} requests, {args.concurrency} concurrent clients")
+            results[scenario] = await run_scenario(client, scenario, args.requests, args.concurrency)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test and latency regression check")
+    parser.add_argument("--mongo-url", default=os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default=f"petrol_pump_loadtest_{uuid.uuid4().hex[:6]}")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--base-url", help="test an already running backend instead of starting one")
+    parser.add_argument("--session-token", help="session token to use with --base-url")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per route")
+    parser.add_argument("--scenarios", nargs="*", choices=list(SCENARIOS), help="routes to drive (default all)")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed regression fraction")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    args = parser.parse_args()
+
+    server = None
+    if args.base_url:
+        if not args.session_token:
+            parser.error("--base-url requires --session-token")
+        base_url, session_token = args.base_url.rstrip("/"), args.session_token
+    else:
+        session_token = seed_database(args.mongo_url, args.db_name)
+        server = start_server(args.mongo_url, args.db_name, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        results = asyncio.run(run_load_test(args, base_url, session_token))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+            MongoClient(args.mongo_url).drop_database(args.db_name)
+
+    print("\n" + "=" * 100)
+    print(f"{'Route':<36}{'Requests':>10}{'Errors':>8}{'Req/s':>10}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    print("=" * 100)
+    for scenario, result in results.items():
+        print(
+            f"{scenario:<36}{result['requests']:>10}{result['errors']:>8}{result['throughput_rps']:>10}"
+            f"{result['p50_ms']:>11}{result['p95_ms']:>11}{result['p99_ms']:>11}"
+        )
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\n✅ Baseline written to {args.baseline}")
+        return
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    if not baseline:
+        print(f"\n⚠️  No baseline at {args.baseline}; run with --update-baseline to record one")
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ Latency regressions detected:")
+        for regression in regressions:
+            print(f"   {regression}")
+        sys.exit(1)
+    print("\n🎉 No regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Serialization Benchmark for Petrol Pump Management System
+Compares the old list-route response path with the projected ORJSON one,
+and the JSON wire format with MessagePack: size, gzipped size and the time
+a client needs to parse each
+"""
+
+import argparse
+import gzip
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone
+
+import msgpack
+import orjson
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+
+def make_fuel_sales(count, with_object_id):
+    """Documents shaped like fuel_sales as Motor returns them"""
+    sales = []
+    for index in range(count):
+        sale = {
+            "id": str(uuid.uuid4()),
+            "user_id": "benchmark-user",
+            "date": "2024-01-01",
+            "fuel_type": "Petrol" if index % 2 else "Diesel",
+            "nozzle_id": f"N{index % 8}",
+            "opening_reading": 1000.0 + index,
+            "closing_reading": 1100.5 + index,
+            "liters": 100.5,
+            "rate": 102.63,
+            "amount": 10314.32,
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+        }
+        if with_object_id:
+            sale["_id"] = ObjectId()
+        sales.append(sale)
+    return sales
+
+
+def before(sales):
+    """Full documents, _id deleted in Python, FastAPI's default encoder"""
+    for sale in sales:
+        if "_id" in sale:
+            del sale["_id"]
+    return JSONResponse(jsonable_encoder(sales)).body
+
+
+def after(sales):
+    """Documents projected without _id, rendered straight by orjson"""
+    return ORJSONResponse(sales).body
+
+
+def msgpack_default(value):
+    """Datetimes as the same ISO text orjson writes, as the backend does"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def as_msgpack(sales):
+    return msgpack.packb(sales, default=msgpack_default)
+
+
+def median_seconds(function, argument, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def compare_wire_formats(count, repeat):
+    """Encoded and gzipped size, encode and parse time of one list response"""
+    sales = make_fuel_sales(count, with_object_id=False)
+    json_body = ORJSONResponse(sales).body
+    msgpack_body = as_msgpack(sales)
+    return {
+        "JSON (orjson)": {
+            "bytes": len(json_body),
+            "gzip_bytes": len(gzip.compress(json_body, 6)),
+            "encode": median_seconds(lambda value: ORJSONResponse(value).body, sales, repeat),
+            "parse": median_seconds(orjson.loads, json_body, repeat),
+            "parse_stdlib": median_seconds(json.loads, json_body, repeat),
+        },
+        "MessagePack": {
+            "bytes": len(msgpack_body),
+            "gzip_bytes": len(gzip.compress(msgpack_body, 6)),
+            "encode": median_seconds(as_msgpack, sales, repeat),
+            "parse": median_seconds(msgpack.unpackb, msgpack_body, repeat),
+            "parse_stdlib": None,
+        },
+    }
+
+
+def measure(render, count, with_object_id, repeat):
+    timings = []
+    for _ in range(repeat):
+        sales = make_fuel_sales(count, with_object_id)
+        started = time.perf_counter()
+        body = render(sales)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1000, help="records per response")
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per path")
+    args = parser.parse_args()
+
+    print(f"🔍 Serializing {args.records} fuel sales, median of {args.repeat} runs")
+    print("=" * 70)
+
+    before_seconds, before_bytes = measure(before, args.records, True, args.repeat)
+    after_seconds, after_bytes = measure(after, args.records, False, args.repeat)
+
+    per_thousand = 1000 / args.records
+    print(f"Before (del _id + jsonable_encoder + json): {before_seconds * 1000 * per_thousand:8.2f} ms / 1000 records, {before_bytes} bytes")
+    print(f"After  (projection + orjson):               {after_seconds * 1000 * per_thousand:8.2f} ms / 1000 records, {after_bytes} bytes")
+    print(f"🎯 Speedup: {before_seconds / after_seconds:.1f}x")
+
+    print(f"\n🔍 Wire formats for {args.records} fuel sales, median of {args.repeat} runs")
+    print("=" * 70)
+    formats = compare_wire_formats(args.records, args.repeat)
+    for name, result in formats.items():
+        print(
+            f"{name:<14} {result['bytes']:>9} bytes, {result['gzip_bytes']:>8} gzipped, "
+            f"encode {result['encode'] * 1000:6.2f} ms, parse {result['parse'] * 1000:6.2f} ms"
+        )
+    print(f"JSON parsed with the stdlib json module (closest to a JS JSON.parse): "
+          f"{formats['JSON (orjson)']['parse_stdlib'] * 1000:.2f} ms")
+    json_result, msgpack_result = formats["JSON (orjson)"], formats["MessagePack"]
+    print(f"🎯 MessagePack is {msgpack_result['bytes'] / json_result['bytes']:.0%} of the JSON size "
+          f"({msgpack_result['gzip_bytes'] / json_result['gzip_bytes']:.0%} gzipped)")
+
+
+if __name__ == "__main__":
+    main()
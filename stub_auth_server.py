@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Stub Auth Server for Petrol Pump Management System
+Local stand-in for the Emergent OAuth session-data endpoint
+
+Start the backend with
+    AUTH_SESSION_DATA_URL=http://localhost:8002/auth/v1/env/oauth/session-data
+and the X-Session-ID sent to /api/auth/session selects the behaviour:
+    invalid-*  404, as for an unknown session
+    flaky-*    503 on the first call for that id, then success
+    slow-*     waits STUB_AUTH_DELAY seconds before answering
+    anything   success, with a user derived from the session id
+"""
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SESSION_DATA_PATH = "/auth/v1/env/oauth/session-data"
+SLOW_DELAY = float(os.getenv('STUB_AUTH_DELAY', '15'))
+
+
+class StubAuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real service
+    flaky_seen = set()
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != SESSION_DATA_PATH:
+            self.send_json(404, {"detail": "Not found"})
+            return
+
+        session_id = self.headers.get("X-Session-ID", "")
+        if not session_id or session_id.startswith("invalid-"):
+            self.send_json(404, {"detail": "Session not found"})
+            return
+        if session_id.startswith("flaky-") and session_id not in self.flaky_seen:
+            self.flaky_seen.add(session_id)
+            self.send_json(503, {"detail": "Temporarily unavailable"})
+            return
+        if session_id.startswith("slow-"):
+            time.sleep(SLOW_DELAY)
+
+        user_id = f"stub-{session_id}"
+        self.send_json(200, {
+            "id": user_id,
+            "email": f"{user_id}@example.com",
+            "name": f"Stub User {session_id}",
+            "picture": None,
+            "session_token": f"token-{session_id}-{int(time.time() * 1000)}",
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OAuth session-data server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), StubAuthHandler)
+    print(f"🔗 Stub auth server: http://{args.host}:{args.port}{SESSION_DATA_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py reads these at import; no database is contacted by the unit tests
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "petrol_pump_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,74 @@
+import json
+
+import msgpack
+import pytest
+
+import server
+
+RECORDS = [
+    ("fuel_sales", {"id": "f1", "date": "2024-01-02", "liters": 10.5, "note": "pump é {\"]"}),
+    ("fuel_sales", {"id": "f2", "date": "2024-01-02", "liters": 3.0, "note": ""}),
+    ("credit_sales", {"id": "c1", "date": "2024-01-03", "customer_name": "अक", "amount": 5}),
+]
+USER = {"id": "u1", "email": "a@b.c", "name": "A"}
+
+
+def json_backup(records):
+    document = {"user": USER}
+    for name in server.DATA_COLLECTIONS:
+        document[name] = [record for collection, record in records if collection == name]
+    document["backup_date"] = "2024-01-04T00:00:00+00:00"
+    return json.dumps(document, ensure_ascii=False).encode()
+
+
+def framed_entries(records):
+    return (
+        [{"type": "user", "data": USER}]
+        + [{"type": name, "data": record} for name, record in records]
+        + [{"type": "backup_date", "data": "2024-01-04T00:00:00+00:00"}]
+    )
+
+
+def ndjson_backup(records):
+    return b"".join(json.dumps(entry, ensure_ascii=False).encode() + b"\n" for entry in framed_entries(records))
+
+
+def msgpack_backup(records):
+    return b"".join(msgpack.packb(entry) for entry in framed_entries(records))
+
+
+FORMATS = [
+    ("json", json_backup),
+    ("ndjson", ndjson_backup),
+    ("msgpack", msgpack_backup),
+]
+
+
+def parse(backup_format, body, chunk_size):
+    parser = server.BACKUP_PARSERS[backup_format]()
+    records = []
+    for start in range(0, len(body), chunk_size):
+        records += parser.feed(body[start:start + chunk_size])
+    return records + parser.feed(b"", final=True)
+
+
+@pytest.mark.parametrize("backup_format, encode", FORMATS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 1 << 16])
+def test_chunked_body_parses_to_the_same_records(backup_format, encode, chunk_size):
+    assert parse(backup_format, encode(RECORDS), chunk_size) == RECORDS
+
+
+@pytest.mark.parametrize("backup_format, encode", FORMATS)
+@pytest.mark.parametrize("cut", [2, 5, 20])  # each cuts into the last entry
+def test_truncated_body_is_rejected(backup_format, encode, cut):
+    body = encode(RECORDS)
+    with pytest.raises(ValueError):
+        parse(backup_format, body[:-cut], 1)
+
+
+@pytest.mark.parametrize("backup_format, encode", FORMATS)
+def test_oversized_record_is_rejected(backup_format, encode):
+    # Only the incomplete record is bounded, so make it overflow mid-stream
+    huge = [("fuel_sales", {"id": "f1", "date": "2024-01-02", "note": "x" * (2 * server.MAX_RESTORE_RECORD_BYTES)})]
+    with pytest.raises(ValueError, match="too large"):
+        parse(backup_format, encode(huge), 1 << 16)
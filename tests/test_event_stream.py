@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import server
+
+USER = server.User(id="u1", email="a@b.c", name="A")
+
+
+async def collect(stream, publish=None, limit=2.0):
+    """Messages yielded until the stream ends, publishing an event every 10ms if asked"""
+    messages = []
+
+    async def read():
+        async for message in stream:
+            messages.append(message)
+
+    reader = asyncio.create_task(read())
+    deadline = time.monotonic() + limit
+    while not reader.done() and time.monotonic() < deadline:
+        if publish:
+            server.event_broker.publish("u1", "fuel_sales.created", {"id": "s1"})
+        await asyncio.sleep(0.01)
+    assert reader.done(), "stream kept running"
+    return messages
+
+
+def test_stream_closes_once_session_is_gone_even_while_busy(monkeypatch):
+    valid = {"tok1"}
+
+    async def user_for_session(session_token):
+        return USER if session_token in valid else None
+
+    monkeypatch.setattr(server, "user_for_session", user_for_session)
+    monkeypatch.setattr(server, "EVENT_HEARTBEAT_SECONDS", 0.05)
+
+    async def scenario():
+        stream = server._event_stream(USER, "tok1", time.time() + 60)
+        asyncio.get_running_loop().call_later(0.2, valid.clear)  # logout
+        return await collect(stream, publish=True)
+
+    messages = asyncio.run(scenario())
+    assert b": heartbeat\n\n" in messages
+    assert any(message.startswith(b"id:") for message in messages)
+
+
+def test_stream_closes_when_session_expires(monkeypatch):
+    async def user_for_session(session_token):
+        return USER
+
+    monkeypatch.setattr(server, "user_for_session", user_for_session)
+
+    async def scenario():
+        return await collect(server._event_stream(USER, "tok1", time.time() + 0.1))
+
+    assert asyncio.run(scenario()) == [b"retry: 3000\n\n"]
@@ -0,0 +1,21 @@
+import msgpack
+import pytest
+
+import server
+
+
+def decode(value):
+    return msgpack.unpackb(msgpack.packb(value), object_pairs_hook=server._str_keyed_map)
+
+
+def test_str_keys_decode_to_dicts():
+    assert decode([{"date": "2024-01-02", "nested": {"a": 1}}]) == [{"date": "2024-01-02", "nested": {"a": 1}}]
+
+
+@pytest.mark.parametrize("value", [
+    [{b"date": "2024-01-02"}],
+    {"date": "2024-01-02", "nested": {b"a": 1}},
+])
+def test_bytes_keys_are_rejected(value):
+    with pytest.raises(ValueError):
+        decode(value)
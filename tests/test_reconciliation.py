@@ -0,0 +1,82 @@
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import server
+
+
+def sale(record_id, opening, closing, nozzle_id="N1", date="2024-01-02", fuel_type="Petrol", rate=100.0,
+         liters=None, amount=None, minute=0):
+    liters = closing - opening if liters is None else liters
+    return {
+        "id": record_id, "date": date, "created_at": datetime(2024, 1, 2, 8, minute), "nozzle_id": nozzle_id,
+        "fuel_type": fuel_type, "opening_reading": opening, "closing_reading": closing, "liters": liters,
+        "rate": rate, "amount": liters * rate if amount is None else amount,
+    }
+
+
+def rate(date, value, fuel_type="Petrol", minute=0):
+    return {"date": date, "created_at": datetime(2024, 1, 1, 8, minute), "fuel_type": fuel_type, "rate": value}
+
+
+PETROL_100 = [rate("2024-01-01", 100.0)]
+
+# (case, sales, rates, issues of each flagged sale id)
+CASES = [
+    ("consistent readings", [sale("s1", 100, 110), sale("s2", 110, 125, minute=1)], PETROL_100, {}),
+    ("gap to the next opening reading", [sale("s1", 100, 110), sale("s2", 112, 125, minute=1)], PETROL_100,
+     {"s1": ["reading_gap"]}),
+    ("readings compared in date then created_at order, not insertion order",
+     [sale("s2", 110, 125, minute=1), sale("s1", 100, 110)], PETROL_100, {}),
+    ("last sale of a nozzle is not compared with the next nozzle",
+     [sale("s1", 100, 110, nozzle_id="N1"), sale("s2", 500, 520, nozzle_id="N2")], PETROL_100, {}),
+    ("liters differ from the readings", [sale("s1", 100, 110, liters=9, amount=900)], PETROL_100,
+     {"s1": ["liters_mismatch"]}),
+    ("amount differs from liters * rate", [sale("s1", 100, 110, amount=990)], PETROL_100,
+     {"s1": ["amount_mismatch"]}),
+    ("differences within tolerance pass", [sale("s1", 100, 110, amount=1000.005)], PETROL_100, {}),
+    ("rate differs from the rate in force", [sale("s1", 100, 110, rate=95.0)], PETROL_100,
+     {"s1": ["rate_mismatch"]}),
+    ("later same-day rate supersedes the earlier one",
+     [sale("s1", 100, 110, rate=105.0), sale("s2", 110, 120, rate=100.0, minute=1)],
+     [rate("2024-01-01", 100.0), rate("2024-01-01", 105.0, minute=1)],
+     {"s2": ["rate_mismatch"]}),
+    ("rates dated after the sale are not in force", [sale("s1", 100, 110)],
+     PETROL_100 + [rate("2024-01-05", 110.0)], {}),
+    ("rates are matched by fuel type", [sale("s1", 100, 110, fuel_type="Diesel")], PETROL_100,
+     {"s1": ["rate_missing"]}),
+    ("sale dated before any rate", [sale("s1", 100, 110, date="2023-12-31")], PETROL_100,
+     {"s1": ["rate_missing"]}),
+    ("no rates at all", [sale("s1", 100, 110)], [], {"s1": ["rate_missing"]}),
+]
+
+
+def reconcile(sales, rates):
+    return server.reconcile_sales(
+        pd.DataFrame(sales, columns=server.RECONCILE_SALE_FIELDS),
+        pd.DataFrame(rates, columns=["date", "created_at", "fuel_type", "rate"]),
+    )
+
+
+@pytest.mark.parametrize("sales, rates, expected", [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_reconcile_sales(sales, rates, expected):
+    report = reconcile(sales, rates)
+
+    assert report["checked"] == len(sales)
+    assert {record["id"]: record["issues"] for record in report["records"]} == expected
+    assert sum(report["issues"].values()) == sum(len(issues) for issues in expected.values())
+
+
+def test_flagged_record_reports_expected_values():
+    report = reconcile([sale("s1", 100, 110, amount=990), sale("s2", 112, 125, minute=1)], [])
+
+    first = report["records"][0]
+    assert first["expected"] == {"next_opening_reading": 112.0, "liters": 10.0, "amount": 1000.0, "rate": None}
+    assert report["records"][1]["expected"]["next_opening_reading"] is None
+
+
+def test_no_sales():
+    report = reconcile([], PETROL_100)
+
+    assert report == {"checked": 0, "nozzles": 0, "issues": {check: 0 for check in server.RECONCILE_CHECKS}, "records": []}
@@ -0,0 +1,11 @@
+import server
+
+
+def test_etag_differs_between_users_at_the_same_version():
+    versions = server.RecordVersions()
+
+    first = versions.etag("u1", "fuel_sales", "2024-01-02", 0)
+    second = versions.etag("u2", "fuel_sales", "2024-01-02", 0)
+
+    assert first != second
+    assert first == versions.etag("u1", "fuel_sales", "2024-01-02", 0)
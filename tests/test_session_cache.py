@@ -0,0 +1,17 @@
+from datetime import datetime, timedelta, timezone
+
+import server
+
+
+def test_set_is_skipped_after_racing_invalidation():
+    cache = server.SessionCache()
+    user = server.User(id="u1", email="a@b.c", name="A")
+    expires_at = datetime.now(timezone.utc) + timedelta(days=1)
+
+    generation = cache.generation
+    cache.invalidate_user("u1")  # logout while the session was being read
+    cache.set("tok1", user, expires_at, "s1", generation)
+    assert cache.get("tok1") is None
+
+    cache.set("tok1", user, expires_at, "s1", cache.generation)
+    assert cache.get("tok1") == user
@@ -0,0 +1,22 @@
+from datetime import datetime, timezone
+
+import server
+
+
+def issue(created_at):
+    user = {"id": "u1", "email": "a@b.c", "name": "A", "created_at": created_at}
+    return server.SignedSessions().issue(user, 1)[0]
+
+
+def test_verify_keeps_account_creation_time():
+    created_at = datetime(2024, 1, 2, 3, 4, 5)  # naive, as read back from MongoDB
+    token = issue(created_at)
+
+    assert server.SignedSessions().verify(token).created_at == created_at.replace(tzinfo=timezone.utc)
+
+
+def test_non_ascii_signature_is_rejected():
+    token = issue(datetime.now(timezone.utc))
+    signed_part, _, _ = token.rpartition(".")
+
+    assert server.SignedSessions().decode(signed_part + ".sïgnature") is None
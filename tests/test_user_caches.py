@@ -0,0 +1,82 @@
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+import server
+
+
+class SlowCursor:
+    """Yields its documents only once released, like a cursor still in flight"""
+
+    def __init__(self, documents, released):
+        self.documents = list(documents)
+        self.released = released
+
+    def sort(self, *args):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self.released.wait()
+        if not self.documents:
+            raise StopAsyncIteration
+        return self.documents.pop(0)
+
+
+class Collection:
+    def __init__(self, documents, released):
+        self.documents = documents
+        self.released = released
+
+    def find(self, *args):
+        return SlowCursor(self.documents, self.released)
+
+
+def rate(date, value):
+    return {"id": date, "user_id": "u1", "fuel_type": "Petrol", "date": date, "rate": value,
+            "created_at": datetime(2024, 1, 1)}
+
+
+def test_rate_added_during_history_load_is_not_lost(monkeypatch):
+    async def scenario():
+        released = asyncio.Event()
+        stored = [rate("2024-01-01", 100.0)]
+        monkeypatch.setattr(server, "db", SimpleNamespace(fuel_rates=Collection(stored, released)))
+        index = server.RateIndex()
+
+        lookup = asyncio.create_task(index.effective("u1", "2024-02-01"))
+        await asyncio.sleep(0)
+        # Written after the cursor's snapshot: only add() knows about it
+        index.add(rate("2024-01-15", 105.0))
+        released.set()
+        await lookup
+
+        stored.append(rate("2024-01-15", 105.0))
+        return await index.effective("u1", "2024-02-01")
+
+    assert asyncio.run(scenario())["Petrol"]["rate"] == 105.0
+
+
+def test_sale_recorded_during_readings_load_is_not_lost(monkeypatch):
+    reading = {"nozzle_id": "N1", "fuel_type": "Petrol", "closing_reading": 100.0, "date": "2024-01-01",
+               "created_at": datetime(2024, 1, 1), "sale_id": "s1"}
+
+    async def scenario():
+        released = asyncio.Event()
+        stored = [reading]
+        monkeypatch.setattr(server, "db", SimpleNamespace(nozzle_readings=Collection(stored, released)))
+        readings = server.NozzleReadings()
+
+        load = asyncio.create_task(readings.get("u1"))
+        await asyncio.sleep(0)
+        newer = {**reading, "closing_reading": 150.0, "date": "2024-01-02", "sale_id": "s2"}
+        readings.apply({**newer, "user_id": "u1"})
+        released.set()
+        await load
+
+        stored[:] = [newer]
+        return await readings.get("u1")
+
+    assert asyncio.run(scenario())["N1"]["closing_reading"] == 150.0
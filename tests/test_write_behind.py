@@ -0,0 +1,136 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import server
+
+
+def credit_entry(record_id):
+    return {
+        "collection": "credit_sales",
+        "document": {
+            "id": record_id,
+            "user_id": "u1",
+            "date": "2024-01-02",
+            "customer_name": "Customer",
+            "amount": 5.0,
+            "created_at": "2024-01-02T08:00:00+00:00",
+            "updated_at": "2024-01-02T08:00:00+00:00",
+        },
+    }
+
+
+async def start_and_stop(directory):
+    """Run a buffer over directory, returning the documents it flushed"""
+    buffer = server.WriteBehindBuffer(
+        directory, batch_size=100, flush_interval=0.01, max_pending=1000, enqueue_timeout=1,
+    )
+    flushed = []
+
+    async def insert_batch(collection_name, documents):
+        flushed.extend((collection_name, document["id"]) for document in documents)
+
+    buffer._insert_batch = insert_batch
+    await buffer.start()
+    await asyncio.sleep(0.1)
+    await buffer.stop()
+    return flushed
+
+
+@pytest.mark.parametrize("journal_name", [
+    "journal-1.ndjson",  # another worker's journal
+    f"journal-{os.getpid()}.ndjson",  # a crashed worker whose PID this process reuses
+    f"journal-{os.getpid()}-0123abcd.ndjson",
+])
+def test_orphaned_journal_is_replayed(tmp_path, journal_name):
+    journal = tmp_path / journal_name
+    # The torn last line was never acknowledged and is skipped
+    journal.write_bytes(json.dumps(credit_entry("c1")).encode() + b"\n" + b'{"collection": "cre')
+
+    flushed = asyncio.run(start_and_stop(tmp_path))
+
+    assert flushed == [("credit_sales", "c1")]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_journal_of_live_worker_is_left_alone(tmp_path):
+    import fcntl
+
+    journal = tmp_path / "journal-1.ndjson"
+    journal.write_bytes(json.dumps(credit_entry("c1")).encode() + b"\n")
+    with open(journal, "rb") as owned:
+        fcntl.flock(owned, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        flushed = asyncio.run(start_and_stop(tmp_path))
+
+    assert flushed == []
+    assert journal.read_bytes() == json.dumps(credit_entry("c1")).encode() + b"\n"
+
+
+def test_flush_stamps_updated_at_at_insert_time(tmp_path, monkeypatch):
+    acknowledged = server.datetime(2024, 1, 2, tzinfo=server.timezone.utc)
+    documents = [dict(credit_entry("c1")["document"], updated_at=acknowledged)]
+    inserted = []
+
+    class Collection:
+        async def insert_many(self, batch, ordered):
+            inserted.extend(dict(document) for document in batch)
+
+    async def on_records_inserted(collection_name, batch):
+        pass
+
+    monkeypatch.setattr(server, "db", {"credit_sales": Collection()})
+    monkeypatch.setattr(server, "on_records_inserted", on_records_inserted)
+    buffer = server.WriteBehindBuffer(tmp_path, batch_size=100, flush_interval=1, max_pending=10, enqueue_timeout=1)
+    asyncio.run(buffer._insert_batch("credit_sales", documents))
+
+    assert inserted[0]["updated_at"] > acknowledged
+
+
+def test_enqueue_rejects_stored_and_pending_ids(tmp_path, monkeypatch):
+    class Cursor:
+        def __init__(self, documents):
+            self.documents = iter(documents)
+
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            try:
+                return next(self.documents)
+            except StopIteration:
+                raise StopAsyncIteration
+
+    lookups = []
+
+    class Collection:
+        def find(self, query, projection):
+            lookups.append(query["id"]["$in"])
+            return Cursor([{"id": "stored"}] if "stored" in query["id"]["$in"] else [])
+
+    monkeypatch.setattr(server, "db", {"credit_sales": Collection()})
+
+    async def scenario():
+        buffer = server.WriteBehindBuffer(tmp_path, batch_size=100, flush_interval=60, max_pending=10, enqueue_timeout=1)
+        flushed = []
+
+        async def insert_batch(collection_name, documents):
+            flushed.extend(document["id"] for document in documents)
+
+        buffer._insert_batch = insert_batch
+        await buffer.start()
+        documents = [credit_entry(record_id)["document"] for record_id in ("c1", "stored", "c1")]
+        first = await buffer.enqueue("credit_sales", documents, {0, 1, 2})
+        # A generated id skips the database lookup but not the pending check
+        second = await buffer.enqueue("credit_sales", [credit_entry("c1")["document"]], set())
+        await buffer.stop()
+        return first, second, flushed, buffer._queued_ids["credit_sales"]
+
+    first, second, flushed, pending_ids = asyncio.run(scenario())
+
+    assert first == {1, 2}
+    assert second == {0}
+    assert lookups == [["c1", "stored", "c1"]]
+    assert flushed == ["c1"]
+    assert pending_ids == set()